@@ -0,0 +1,252 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from mpc2graph import read_header
+from run import read_circuit
+
+AND, XOR, INV, COPY = 0, 1, 2, 3
+OPS = {"AND": AND, "XOR": XOR, "INV": INV}
+
+
+def compile_ops(ops, n_slots, n_inputs, outputs):
+    """Group ops into levels of same-type NumPy steps.
+
+    ops are (op, a, b, out) over value slots, in an order where every slot
+    is written before it is read; slots below n_inputs are the input bits.
+    An op's level is one more than the deepest op it reads from, so the ops
+    of one level never depend on each other and run as one array operation
+    per type. outputs are the slots holding the output bits.
+    """
+    slot_level = [0 for s in range(n_slots)]
+    written = bytearray(n_slots)
+    written[:n_inputs] = b"\x01" * n_inputs
+
+    levels = []
+    for op, a, b, out in ops:
+        if not (written[a] and written[b]):
+            raise ValueError("slot " + str(a if not written[a] else b) + " is read before it is written")
+        if written[out]:
+            raise ValueError("slot " + str(out) + " is written twice")
+        written[out] = 1
+        level = max(slot_level[a], slot_level[b]) + 1
+        slot_level[out] = level
+        levels.append(level)
+
+    steps = []
+    if ops:
+        op_arr = np.array(ops, dtype=np.int64)
+        key = np.array(levels, dtype=np.int64) * 4 + op_arr[:, 0]
+        order = np.argsort(key, kind="stable")
+        keys, starts = np.unique(key[order], return_index=True)
+        for key_k, group in zip(keys.tolist(), np.split(order, starts[1:])):
+            steps.append((key_k % 4, op_arr[group, 1], op_arr[group, 2], op_arr[group, 3]))
+
+    return {"n_slots": n_slots, "n_inputs": n_inputs, "steps": steps, "outputs": np.asarray(outputs, dtype=np.int64)}
+
+
+def compile_circuit(path):
+    """Program for a whole circuit file: slots are wire numbers."""
+    (num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs), gates = read_circuit(path)
+    ops = []
+    for input_wires, out, gate_type in gates:
+        if gate_type not in OPS:
+            raise ValueError("Unknown gate type " + gate_type)
+        ops.append((OPS[gate_type], input_wires[0], input_wires[-1], out))
+
+    return compile_ops(ops, num_wires, num_a_inputs + num_b_inputs, range(num_wires - num_outputs, num_wires))
+
+
+def compile_partitioned(directory, name):
+    """Program for the partition files <name>-<i>.txt of a circuit.
+
+    Every partition gets its own slot for each wire it computes or reads,
+    and each line of a meta file's incoming list becomes a copy from the
+    sending partition's slot. A partition reading a wire it neither
+    computes nor receives is an error, so this checks the meta files too.
+    Output bits are read from the lowest partition computing them.
+    """
+    header = None
+    slots = {}
+    partition = 0
+    files = []
+    while os.path.exists(os.path.join(directory, name + "-" + str(partition) + ".txt")):
+        h, gates = read_circuit(os.path.join(directory, name + "-" + str(partition) + ".txt"))
+        header = header or h
+        files.append(gates)
+        partition += 1
+    if not files:
+        raise ValueError("No partitions of " + name + " in " + directory)
+
+    num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs = header
+    n_inputs = num_a_inputs + num_b_inputs
+
+    slot_wire = list(range(n_inputs))
+
+    def slot(p, wire):
+        # Input bits are shared by every partition
+        if wire < n_inputs:
+            return wire
+        if (p, wire) not in slots:
+            slots[(p, wire)] = n_inputs + len(slots)
+            slot_wire.append(wire)
+        return slots[(p, wire)]
+
+    partition_ops = []
+    computed = set()
+    for p, gates in enumerate(files):
+        partition_ops.append([])
+        for input_wires, out, gate_type in gates:
+            if gate_type not in OPS:
+                raise ValueError("Unknown gate type " + gate_type)
+            partition_ops[p].append((OPS[gate_type], slot(p, input_wires[0]), slot(p, input_wires[-1]), slot(p, out)))
+            computed.add((p, out))
+
+    # (partition, wire) -> slots of the partitions it is sent to
+    receivers = {}
+    for p in range(len(files)):
+        with open(os.path.join(directory, name + "-" + str(p) + "-meta.txt"), 'r') as f:
+            _, n_incoming, _ = [int(x) for x in f.readline().split()]
+            for k in range(n_incoming):
+                wire, q = [int(x) for x in f.readline().split()]
+                if (q, wire) not in computed:
+                    raise ValueError("partition " + str(p) + " receives wire " + str(wire) + " from " + str(q) + ", which does not compute it")
+                receivers.setdefault((q, wire), []).append(slot(p, wire))
+
+    # Run the partitions in turn, each until it needs a wire it does not
+    # have yet, with a copy as soon as a sent wire is computed. That puts
+    # the ops in an order compile_ops can take, and shows the partitions
+    # never wait on each other in a cycle.
+    n_slots = n_inputs + len(slots)
+    have = bytearray(n_slots)
+    have[:n_inputs] = b"\x01" * n_inputs
+    ops = []
+    next_op = [0 for p in partition_ops]
+    progress = True
+    while progress:
+        progress = False
+        for p, p_ops in enumerate(partition_ops):
+            k = next_op[p]
+            while k < len(p_ops) and have[p_ops[k][1]] and have[p_ops[k][2]]:
+                op, a, b, out = p_ops[k]
+                ops.append(p_ops[k])
+                have[out] = 1
+                for r in receivers.get((p, slot_wire[out]), ()):
+                    ops.append((COPY, out, out, r))
+                    have[r] = 1
+                k += 1
+            progress = progress or k > next_op[p]
+            next_op[p] = k
+
+    for p, p_ops in enumerate(partition_ops):
+        if next_op[p] < len(p_ops):
+            op, a, b, out = p_ops[next_op[p]]
+            wire = slot_wire[a] if not have[a] else slot_wire[b]
+            raise ValueError("partition " + str(p) + " reads wire " + str(wire) + " but neither computes nor receives it")
+
+    outputs = []
+    for wire in range(num_wires - num_outputs, num_wires):
+        holders = [p for p in range(len(files)) if (p, wire) in computed]
+        if not holders:
+            raise ValueError("no partition computes output wire " + str(wire))
+        outputs.append(slots[(holders[0], wire)])
+
+    return compile_ops(ops, n_slots, n_inputs, outputs)
+
+
+def evaluate(program, inputs):
+    """Evaluate a program on packed input bits.
+
+    inputs is a (n_inputs, words) uint64 array: bit k of word j of row w is
+    input wire w of vector 64 * j + k. Returns the output bits the same way.
+    """
+    values = np.zeros((program["n_slots"], inputs.shape[1]), dtype=np.uint64)
+    values[:program["n_inputs"]] = inputs
+
+    for op, a, b, out in program["steps"]:
+        if op == AND:
+            values[out] = values[a] & values[b]
+        elif op == XOR:
+            values[out] = values[a] ^ values[b]
+        elif op == INV:
+            values[out] = ~values[a]
+        else:
+            values[out] = values[a]
+
+    return values[program["outputs"]]
+
+
+def random_inputs(n_inputs, n_vectors, seed=None):
+    words = (n_vectors + 63) // 64
+    return np.random.default_rng(seed).integers(0, 2**64, size=(n_inputs, words), dtype=np.uint64)
+
+
+def pack(values, n_bits):
+    # Integer inputs (bit w on wire w) -> a (n_bits, words) bit-sliced array
+    words = (len(values) + 63) // 64
+    packed = np.zeros((n_bits, words), dtype=np.uint64)
+    for v, x in enumerate(values):
+        for w in range(n_bits):
+            if (x >> w) & 1:
+                packed[w, v // 64] |= np.uint64(1 << (v % 64))
+    return packed
+
+
+def unpack(packed, n_vectors):
+    # Output bits of each vector as an integer, bit w from output wire w
+    bits = np.unpackbits(packed.view(np.uint8).reshape(packed.shape[0], -1), axis=1, bitorder="little")
+    return [sum(int(bits[w, v]) << w for w in range(packed.shape[0])) for v in range(n_vectors)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate AGMPC circuits on batches of inputs, 64 per machine word.")
+    parser.add_argument("in_file", help="Raw MPC circuit file")
+    parser.add_argument("--partitions", help="Folder with the circuit's partition files, to check against the whole circuit")
+    parser.add_argument("--vectors", type=int, default=4096, help="Number of random input vectors")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the inputs")
+    parser.add_argument("--a", type=int, default=None, help="Evaluate this one party A input instead (bit i on input wire i)")
+    parser.add_argument("--b", type=int, default=0, help="Party B input to go with --a")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    program = compile_circuit(args.in_file)
+    n_inputs = program["n_inputs"]
+    print("Compiled", args.in_file, "into", len(program["steps"]), "steps in {:.2f} s".format(time.perf_counter() - start))
+
+    if args.a is not None:
+        with open(args.in_file, 'r') as f:
+            num_a_inputs = read_header(f)[2]
+        inputs = pack([args.a | (args.b << num_a_inputs)], n_inputs)
+        n_vectors = 1
+    else:
+        inputs = random_inputs(n_inputs, args.vectors, args.seed)
+        n_vectors = args.vectors
+
+    start = time.perf_counter()
+    expected = evaluate(program, inputs)
+    seconds = time.perf_counter() - start
+    print("Evaluated", n_vectors, "input vector(s) in {:.3f} s".format(seconds))
+    if args.a is not None:
+        print("Output:", unpack(expected, 1)[0])
+
+    if args.partitions:
+        name = os.path.splitext(os.path.basename(args.in_file))[0]
+        partitioned = compile_partitioned(args.partitions, name)
+        start = time.perf_counter()
+        outputs = evaluate(partitioned, inputs)
+        print("Evaluated the partitions in {:.3f} s".format(time.perf_counter() - start))
+
+        # Only the bits of real vectors count in the last word
+        mask = np.full(inputs.shape[1], ~np.uint64(0), dtype=np.uint64)
+        if n_vectors % 64:
+            mask[-1] = np.uint64((1 << (n_vectors % 64)) - 1)
+        wrong = np.bitwise_or.reduce((outputs ^ expected) & mask, axis=0) if len(outputs) else np.zeros_like(mask)
+        n_wrong = int(np.unpackbits(wrong.view(np.uint8)).sum())
+        if n_wrong:
+            print("ERROR:", n_wrong, "of", n_vectors, "input vectors give different outputs", file=sys.stderr)
+            sys.exit(1)
+        print("Partition outputs match on all", n_vectors, "input vectors")
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import sys
+
+from mpc2graph import gate_name, read_gates, read_header
+
+
+def gate_line(input_wires, output_wires, gate_type):
+    return " ".join(str(x) for x in [len(input_wires), len(output_wires)] + input_wires + output_wires + [gate_type]) + "\n"
+
+
+def emit(in_file, groups, output_directory, n_partitions=None, copies=None):
+    """Write the files the partition binary writes for an existing partition.
+
+    groups maps gate names (as mpc2graph.py names them) to partitions. Gates
+    are read once and each wire's producing and reading partitions are kept
+    in a dict, so the work is linear in the size of the circuit. Without
+    n_partitions, the highest partition number decides how many are written.
+
+    copies maps gate names to the other partitions evaluating a copy of the
+    gate (see viz/replicate.py). A copied wire is only sent to partitions
+    without a copy, and only by the partition in groups.
+    """
+    copies = copies or {}
+    circuit_name = os.path.splitext(os.path.basename(in_file))[0]
+    output_path = os.path.join(output_directory, circuit_name)
+
+    if n_partitions is None:
+        n_partitions = max([g for n, g in groups.items() if n.startswith("GATE_")] + [-1]) + 1
+
+    with open(in_file, 'r') as f:
+        num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs = read_header(f)
+        header = str(num_gates) + " " + str(num_wires) + "\n" + \
+            str(num_a_inputs) + " " + str(num_b_inputs) + " " + str(num_outputs) + "\n\n"
+
+        outs = [open(output_path + "-" + str(i) + ".txt", 'w') for i in range(n_partitions)]
+        with open(output_path + ".txt", 'w') as full_out:
+            full_out.write(header)
+            for o in outs:
+                o.write(header)
+
+            # wire -> partition producing it, the partitions holding a copy of
+            # it, and the partitions reading it
+            producer = {}
+            holders = {}
+            consumers = {}
+            partition_inputs = [set() for i in range(n_partitions)]
+            partition_outputs = [set() for i in range(n_partitions)]
+
+            for line_number, input_wires, output_wires, gate_type in read_gates(f):
+                if len(input_wires) > 2 or len(output_wires) > 1:
+                    print("ERROR: bad gate | inputs:", len(input_wires), "outputs:", len(output_wires), file=sys.stderr)
+                    continue
+
+                gate = gate_name(gate_type, line_number)
+                if groups.get(gate, -1) < 0:
+                    raise ValueError(gate + " is not in a partition")
+                i = groups[gate]
+
+                line = gate_line(input_wires, output_wires, gate_type)
+                full_out.write(line)
+
+                for j in [i] + [p for p in copies.get(gate, ()) if p != i]:
+                    outs[j].write(line)
+
+                    # Input and output bits are never sent
+                    for iw in input_wires:
+                        if iw >= num_a_inputs + num_b_inputs:
+                            partition_inputs[j].add(iw)
+                            consumers.setdefault(iw, set()).add(j)
+                    for ow in output_wires:
+                        if ow < num_wires - num_outputs:
+                            partition_outputs[j].add(ow)
+                            holders.setdefault(ow, set()).add(j)
+
+                for ow in output_wires:
+                    if ow < num_wires - num_outputs:
+                        producer[ow] = i
+
+        for o in outs:
+            o.close()
+
+    for i in range(n_partitions):
+        incoming = sorted(partition_inputs[i] - partition_outputs[i])
+        outgoing = sorted(partition_outputs[i] - partition_inputs[i])
+
+        with open(output_path + "-" + str(i) + "-meta.txt", 'w') as meta:
+            meta.write(str(i) + " " + str(len(incoming)) + " " + str(len(outgoing)) + "\n")
+            # <wire> <partition it comes from>, then <wire> <partition it goes to>
+            for iw in incoming:
+                if iw in producer:
+                    meta.write(str(iw) + " " + str(producer[iw]) + "\n")
+            for ow in outgoing:
+                if producer.get(ow) != i:
+                    continue
+                for j in sorted(consumers.get(ow, set()) - holders[ow]):
+                    meta.write(str(ow) + " " + str(j) + "\n")
+
+    return n_partitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split an AGMPC circuit by a partitioned graph json, like the partition binary does.")
+    parser.add_argument("in_file", help="Raw MPC circuit file location")
+    parser.add_argument("partition_file", help="Partitioned graph json file (e.g. from viz/fennel.py or viz/replicate.py)")
+    parser.add_argument("output_directory", help="Folder for the output circuit files")
+    parser.add_argument("--partitions", type=int, default=None, help="Number of partition files to write (default: highest partition + 1)")
+
+    args = parser.parse_args()
+
+    with open(args.partition_file, 'r') as f:
+        nodes = json.load(f)["nodes"]
+    groups = {n["id"]: n["group"] for n in nodes if isinstance(n.get("group"), int)}
+    copies = {n["id"]: n["copies"] for n in nodes if n.get("copies")}
+
+    n_partitions = emit(args.in_file, groups, args.output_directory, args.partitions, copies)
+    print("Wrote", n_partitions, "partitions to", args.output_directory)
@@ -0,0 +1,271 @@
+import argparse
+import collections
+import random
+
+KINDS = ["ripple", "cla", "multiplier", "bitonic", "random"]
+
+GATE_LINES = {
+    "AND": "2 1 %d %d %d AND\n",
+    "XOR": "2 1 %d %d %d XOR\n",
+    "INV": "1 1 %d %d INV\n",
+}
+
+
+class Writer:
+    """Hands out wire numbers and writes gate lines.
+
+    Without a file it only counts gates and wires. Output wires have to be
+    the last wires of the circuit, so a gate computing output bit i is given
+    wire num_wires - num_outputs + i, which is only known once the circuit
+    has been counted. Neither the partitioner nor emit.py routes output
+    wires between partitions, so no gate may read one.
+    """
+
+    def __init__(self, num_a_inputs, num_b_inputs, num_outputs, f=None, num_wires=0):
+        self.f = f
+        self.next_wire = num_a_inputs + num_b_inputs
+        self.output_base = num_wires - num_outputs
+        self.num_gates = 0
+        self.num_outputs = 0
+
+    def gate(self, gate_type, inputs, out=None):
+        if out is None:
+            wire = self.next_wire
+            self.next_wire += 1
+        else:
+            wire = self.output_base + out
+            self.num_outputs += 1
+
+        if self.f and max(inputs) >= self.output_base:
+            raise ValueError("gate reads output wire " + str(max(inputs)))
+
+        self.num_gates += 1
+        if self.f:
+            self.f.write(GATE_LINES[gate_type] % (inputs + (wire,)))
+        return wire
+
+    def and_(self, a, b, out=None):
+        return self.gate("AND", (a, b), out)
+
+    def xor(self, a, b, out=None):
+        return self.gate("XOR", (a, b), out)
+
+    def inv(self, a, out=None):
+        return self.gate("INV", (a,), out)
+
+
+def add(w, xs, ys, outs=None):
+    """Ripple-carry sum of little-endian wire lists, ys no longer than xs,
+    with one AND per bit. Returns len(xs) + 1 wires; outs gives the output
+    bit (or None) for each of them."""
+    n = len(xs)
+    outs = outs or [None] * (n + 1)
+
+    sums = [w.xor(xs[0], ys[0], outs[0])]
+    carry = w.and_(xs[0], ys[0], outs[n] if n == 1 else None)
+    for i in range(1, n):
+        last = outs[n] if i == n - 1 else None
+        if i < len(ys):
+            t = w.xor(xs[i], carry)
+            u = w.xor(ys[i], carry)
+            sums.append(w.xor(t, ys[i], outs[i]))
+            carry = w.xor(w.and_(t, u), carry, last)
+        else:
+            sums.append(w.xor(xs[i], carry, outs[i]))
+            carry = w.and_(xs[i], carry, last)
+
+    return sums + [carry]
+
+
+def ripple(w, bits):
+    add(w, list(range(bits)), list(range(bits, 2 * bits)), list(range(bits + 1)))
+
+
+def cla(w, bits):
+    """Kogge-Stone carry-lookahead adder: log2(bits) levels of prefix
+    (generate, propagate) pairs. A bit cannot both generate and propagate, so
+    the OR of the prefix operator is an XOR."""
+    a, b = list(range(bits)), list(range(bits, 2 * bits))
+    p = [w.xor(a[i], b[i], 0 if i == 0 else None) for i in range(bits)]
+    g = [w.and_(a[i], b[i], bits if bits == 1 else None) for i in range(bits)]
+
+    G, P = list(g), list(p)
+    d = 1
+    while d < bits:
+        # Downwards, so G[i - d] is still the previous level's
+        for i in reversed(range(d, bits)):
+            final = i == bits - 1 and i - 2 * d + 1 <= 0
+            G[i] = w.xor(G[i], w.and_(P[i], G[i - d]), bits if final else None)
+            if i >= 2 * d:
+                P[i] = w.and_(P[i], P[i - d])
+        d *= 2
+
+    for i in range(1, bits):
+        w.xor(p[i], G[i - 1], i)
+
+
+def multiplier(w, bits):
+    """Array multiplier, bits x bits -> 2 * bits: each partial product row is
+    added to the running sum shifted right by one, whose lowest bit is then
+    final."""
+    a, b = list(range(bits)), list(range(bits, 2 * bits))
+    acc = [w.and_(a[i], b[0], 0 if i == 0 else None) for i in range(bits)]
+
+    for j in range(1, bits):
+        row = [w.and_(a[i], b[j]) for i in range(bits)]
+        if j == bits - 1:
+            outs = list(range(j, j + bits + 1))
+        else:
+            outs = [j] + [None] * bits
+        acc = add(w, row, acc[1:], outs)
+
+
+def compare_exchange(w, x, y, ascending, outs_x=None, outs_y=None):
+    """Swap x and y (little-endian) if they are out of order. The unsigned
+    comparison takes one AND per bit: gt = hi ^ ((hi ^ gt) & (lo ^ gt))."""
+    width = len(x)
+    outs_x = outs_x or [None] * width
+    outs_y = outs_y or [None] * width
+    hi, lo = (x, y) if ascending else (y, x)
+
+    gt = w.and_(hi[0], w.inv(lo[0]))
+    for i in range(1, width):
+        gt = w.xor(hi[i], w.and_(w.xor(hi[i], gt), w.xor(lo[i], gt)))
+
+    new_x, new_y = [], []
+    for i in range(width):
+        d = w.and_(w.xor(x[i], y[i]), gt)
+        new_x.append(w.xor(x[i], d, outs_x[i]))
+        new_y.append(w.xor(y[i], d, outs_y[i]))
+    return new_x, new_y
+
+
+def bitonic(w, elements, width):
+    """Bitonic sorting network over elements (a power of two) unsigned
+    values of width bits; party A holds the first half of them."""
+    values = [list(range(e * width, (e + 1) * width)) for e in range(elements)]
+
+    k = 2
+    while k <= elements:
+        j = k // 2
+        while j >= 1:
+            last = k == elements and j == 1
+            for i in range(elements):
+                l = i ^ j
+                if l <= i:
+                    continue
+                outs_i = list(range(i * width, (i + 1) * width)) if last else None
+                outs_l = list(range(l * width, (l + 1) * width)) if last else None
+                values[i], values[l] = compare_exchange(w, values[i], values[l], i & k == 0, outs_i, outs_l)
+            j //= 2
+        k *= 2
+
+
+def random_dag(w, gates, inputs, outputs, width, window, mix, seed):
+    """Layers of width gates, each reading wires picked from the previous
+    window layers (the inputs are the first layer). Gate types are drawn in
+    the AND:XOR:INV proportions of mix and the last gates are the outputs,
+    which no gate reads."""
+    rng = random.Random(seed)
+    total = float(sum(mix))
+    p_and, p_xor = mix[0] / total, (mix[0] + mix[1]) / total
+
+    layers = collections.deque([list(range(inputs))], maxlen=window)
+    current = []
+
+    def pick():
+        layer = layers[rng.randrange(len(layers))]
+        return layer[rng.randrange(len(layer))]
+
+    for g in range(gates):
+        if len(current) == width:
+            layers.append(current)
+            current = []
+
+        out = g - (gates - outputs) if g >= gates - outputs else None
+        r = rng.random()
+        if r >= p_xor:
+            wire = w.inv(pick(), out)
+        else:
+            a = pick()
+            b = pick()
+            # A gate reading the same wire twice is constant
+            for i in range(8):
+                if b != a:
+                    break
+                b = pick()
+            wire = w.and_(a, b, out) if r < p_and else w.xor(a, b, out)
+
+        if out is None:
+            current.append(wire)
+
+
+def circuit_spec(args):
+    # (A inputs, B inputs, outputs, build function)
+    if args.kind == "ripple":
+        return args.bits, args.bits, args.bits + 1, lambda w: ripple(w, args.bits)
+    if args.kind == "cla":
+        return args.bits, args.bits, args.bits + 1, lambda w: cla(w, args.bits)
+    if args.kind == "multiplier":
+        if args.bits < 2:
+            raise ValueError("multiplier needs at least 2 bits")
+        return args.bits, args.bits, 2 * args.bits, lambda w: multiplier(w, args.bits)
+    if args.kind == "bitonic":
+        if args.elements < 2 or args.elements & (args.elements - 1):
+            raise ValueError("bitonic needs a power of two elements")
+        half = args.elements // 2 * args.bits
+        return half, half, args.elements * args.bits, lambda w: bitonic(w, args.elements, args.bits)
+    if args.kind == "random":
+        if args.outputs > args.gates:
+            raise ValueError("more outputs than gates")
+        mix = [float(x) for x in args.mix.split(":")]
+        return args.inputs, args.inputs, args.outputs, \
+            lambda w: random_dag(w, args.gates, 2 * args.inputs, args.outputs, args.width, args.window, mix, args.seed)
+
+    raise ValueError("Unknown circuit kind " + args.kind)
+
+
+def generate(args, path):
+    """Write the circuit in two passes: the first only counts gates and wires
+    for the header, the second writes the gate lines. Only the wires still to
+    be read are ever held, so circuits of millions of gates stream to disk.
+    Returns (gates, wires).
+    """
+    num_a_inputs, num_b_inputs, num_outputs, build = circuit_spec(args)
+
+    counter = Writer(num_a_inputs, num_b_inputs, num_outputs)
+    build(counter)
+    num_gates = counter.num_gates
+    num_wires = counter.next_wire + num_outputs
+
+    with open(path, 'w', buffering=1 << 20) as f:
+        f.write(str(num_gates) + " " + str(num_wires) + "\n")
+        f.write(str(num_a_inputs) + " " + str(num_b_inputs) + " " + str(num_outputs) + "\n\n")
+
+        w = Writer(num_a_inputs, num_b_inputs, num_outputs, f, num_wires)
+        build(w)
+
+    if w.num_gates != num_gates or w.num_outputs != num_outputs:
+        raise RuntimeError("the two passes over " + args.kind + " disagree")
+
+    return num_gates, num_wires
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic AGMPC circuits.")
+    parser.add_argument("kind", choices=KINDS, help="Circuit to generate")
+    parser.add_argument("out_file", help="Output circuit file location")
+    parser.add_argument("--bits", type=int, default=32, help="Operand width (adders, multiplier) or element width (bitonic)")
+    parser.add_argument("--elements", type=int, default=64, help="Number of values to sort (bitonic, a power of two)")
+    parser.add_argument("--gates", type=int, default=100000, help="Number of gates (random)")
+    parser.add_argument("--inputs", type=int, default=64, help="Input bits per party (random)")
+    parser.add_argument("--outputs", type=int, default=64, help="Output bits (random)")
+    parser.add_argument("--width", type=int, default=256, help="Gates per layer (random)")
+    parser.add_argument("--window", type=int, default=2, help="Layers back a gate may read from (random)")
+    parser.add_argument("--mix", default="1:2:1", help="AND:XOR:INV proportions (random)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (random)")
+
+    args = parser.parse_args()
+
+    num_gates, num_wires = generate(args, args.out_file)
+    print("Wrote", num_gates, "gates,", num_wires, "wires to", args.out_file)
@@ -1,107 +1,200 @@
 import argparse
 import json
-
-parser = argparse.ArgumentParser(description="Convert AGMPC circuits to visualizable format.")
-parser.add_argument("in_file", help="Input file location")
-parser.add_argument("output_file", help="Output file location")
-
-args = parser.parse_args()
-
-with open(args.in_file, 'r') as f:
-    in_lines = [x.strip().split() for x in f]
-
-nodes = []
-links = []
-
-num_gates, num_wires = [int(x) for x in in_lines[0]]
-num_a_inputs, num_b_inputs, num_outputs = [int(x) for x in in_lines[1]]
-
-for i in range(num_a_inputs):
-    nodes.append({
-        "id": "INPUT_A_"+str(i),
-        "group": "INPUT_A"
-    })
-
-for i in range(num_b_inputs):
-    nodes.append({
-        "id": "INPUT_B_"+str(i),
-        "group": "INPUT_B"
-    })
-
-for i in range(num_outputs):
-    nodes.append({
-        "id": "OUTPUT_"+str(i),
-        "group": "OUTPUT"
-    })
-
-input_wire_map = {}
-for i in range(num_wires):
-    input_wire_map[i] = []
-
-for i, l in enumerate(in_lines[3:]):
-    if not l:
-        continue
-
-    input_num, output_num = int(l[0]), int(l[1])
-
-    input_wires = [int(x) for x in l[2:2+input_num]]
-    output_wires = [int(x) for x in l[2+input_num:2+input_num+output_num]]
-
-    gate_type = l[-1]
-
-    nodes.append({
-        "id": "GATE_"+gate_type+"_"+str(i+4),
-        "group": gate_type
-    })
-
-    for iw in input_wires:
-        if iw < num_a_inputs:
-            links.append({
-                "source": "INPUT_A_"+str(iw),
-                "target": "GATE_"+gate_type+"_"+str(i+4),
-                "value": 1
-            })
-        elif iw < num_a_inputs + num_b_inputs:
-            links.append({
-                "source": "INPUT_B_"+str(iw - num_a_inputs),
-                "target": "GATE_"+gate_type+"_"+str(i+4),
-                "value": 1
-            })
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+
+
+def read_header(f):
+    num_gates, num_wires = [int(x) for x in f.readline().split()]
+    num_a_inputs, num_b_inputs, num_outputs = [int(x) for x in f.readline().split()]
+    f.readline()
+
+    return num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs
+
+
+def read_gates(f):
+    # Gates are named after their (1-based) line number in the circuit file,
+    # the three header lines come first
+    for line_number, l in enumerate(f, 4):
+        l = l.split()
+        if not l:
+            continue
+
+        input_num, output_num = int(l[0]), int(l[1])
+
+        input_wires = [int(x) for x in l[2:2+input_num]]
+        output_wires = [int(x) for x in l[2+input_num:2+input_num+output_num]]
+
+        yield line_number, input_wires, output_wires, l[-1]
+
+
+def gate_name(gate_type, line_number):
+    return "GATE_" + gate_type + "_" + str(line_number)
+
+
+def count_reads(f, num_wires):
+    # Gates reading each wire, so a wire can be forgotten after its last one
+    reads = array('I', bytes(4 * num_wires))
+    for l in f:
+        l = l.split()
+        if l:
+            for x in l[2:2+int(l[0])]:
+                reads[int(x)] += 1
+    return reads
+
+
+def convert(f, indexes=False):
+    """Stream an AGMPC circuit as ("node", node) and ("link", link) items.
+
+    Counts the reads of every wire first, then makes a single pass over the
+    gate lines that only remembers the producing gate of each wire until its
+    last reader has been linked, so f has to be seekable. Input and output
+    bit nodes are yielded first, gate nodes as they are read, and each link
+    as soon as both of its ends are known. Links carry the number of the
+    wire they stand for, so the links fanning out of one wire can be told
+    apart from separate wires. With indexes, link ends are node numbers (in
+    the order the nodes are yielded) instead of names.
+    """
+    num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs = read_header(f)
+
+    gates_start = f.tell()
+    reads = count_reads(f, num_wires)
+    f.seek(gates_start)
+
+    for i in range(num_a_inputs):
+        yield "node", {"id": "INPUT_A_"+str(i), "group": "INPUT_A"}
+
+    for i in range(num_b_inputs):
+        yield "node", {"id": "INPUT_B_"+str(i), "group": "INPUT_B"}
+
+    for i in range(num_outputs):
+        yield "node", {"id": "OUTPUT_"+str(i), "group": "OUTPUT"}
+
+    n_inputs = num_a_inputs + num_b_inputs
+    next_node = n_inputs + num_outputs
+
+    # wire -> line number (or node number, with indexes) of the gate driving
+    # it, while the wire still has readers to come; the gate's type is
+    # line_types[line number]
+    producers = {}
+    type_names = []
+    line_types = bytearray()
+    # wire -> gates that read it before its producer showed up
+    pending = {}
+
+    for line_number, input_wires, output_wires, gate_type in read_gates(f):
+        name = gate_name(gate_type, line_number)
+        yield "node", {"id": name, "group": gate_type}
+        gate = next_node if indexes else name
+        next_node += 1
+
+        for iw in input_wires:
+            if iw < n_inputs and indexes:
+                source = iw
+            elif iw < num_a_inputs:
+                source = "INPUT_A_"+str(iw)
+            elif iw < n_inputs:
+                source = "INPUT_B_"+str(iw - num_a_inputs)
+            elif iw in producers:
+                producer = producers[iw]
+                source = producer if indexes else gate_name(type_names[line_types[producer]], producer)
+                reads[iw] -= 1
+                if not reads[iw]:
+                    del producers[iw]
+            else:
+                pending.setdefault(iw, []).append(gate)
+                continue
+
+            yield "link", {"source": source, "target": gate, "value": 1, "wire": iw}
+
+        if gate_type not in type_names:
+            type_names.append(gate_type)
+        line_types.extend(bytes(line_number + 1 - len(line_types)))
+        line_types[line_number] = type_names.index(gate_type)
+
+        for ow in output_wires:
+            targets = pending.pop(ow, [])
+            reads[ow] -= len(targets)
+            if reads[ow]:
+                producers[ow] = gate if indexes else line_number
+
+            for target in targets:
+                yield "link", {"source": gate, "target": target, "value": 1, "wire": ow}
+
+            if ow >= num_wires - num_outputs:
+                output = ow - (num_wires - num_outputs)
+                target = n_inputs + output if indexes else "OUTPUT_"+str(output)
+                yield "link", {"source": gate, "target": target, "value": 1, "wire": ow}
+
+
+def write_json(items, outfile):
+    # Nodes go straight to the output; links are spooled to a temporary file
+    # and appended once the node list is closed
+    with tempfile.TemporaryFile('w+') as links:
+        outfile.write('{"nodes": [')
+        n_nodes, n_links = 0, 0
+        for kind, item in items:
+            if kind == "node":
+                if n_nodes:
+                    outfile.write(', ')
+                outfile.write(json.dumps(item))
+                n_nodes += 1
+            else:
+                if n_links:
+                    links.write(', ')
+                links.write(json.dumps(item))
+                n_links += 1
+
+        outfile.write('], "links": [')
+        links.seek(0)
+        shutil.copyfileobj(links, outfile)
+        outfile.write(']}')
+
+
+def write_binary(items, path):
+    # The binary format lives with the rest of the circuit tooling in viz/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "viz"))
+    import circuit
+    import numpy as np
+
+    # items come from convert(f, indexes=True), links already name their
+    # ends by node number. Names are packed as they come, like NameTable
+    name_data = bytearray()
+    name_ptr = array('q', [0])
+    types = bytearray()
+    sources = array('l')
+    targets = array('l')
+    wires = array('l')
+    for kind, item in items:
+        if kind == "node":
+            name_data += item["id"].encode()
+            name_ptr.append(len(name_data))
+            types.append(circuit.gate_type(item["id"]))
         else:
-            input_wire_map[iw].append("GATE_"+gate_type+"_"+str(i+4))
-
-    for ow in output_wires:
-        if ow >= num_wires - num_outputs:
-            links.append({
-                "source": "GATE_"+gate_type+"_"+str(i+4),
-                "target": "OUTPUT_"+str(ow - (num_wires - num_outputs)),
-                "value": 1
-            })
-
-for i, l in enumerate(in_lines[3:]):
-    if not l:
-        continue
+            sources.append(item["source"])
+            targets.append(item["target"])
+            wires.append(item["wire"])
 
-    input_num, output_num = int(l[0]), int(l[1])
+    names = circuit.NameTable(np.frombuffer(name_ptr, dtype=np.int64), np.frombuffer(name_data, dtype=np.uint8))
+    c = circuit.from_edges(names, np.frombuffer(types, dtype=np.uint8), np.full(len(names), -1, dtype=np.int32),
+                           sources, targets, wires=wires)
+    circuit.save_binary(c, path)
 
-    input_wires = [int(x) for x in l[2:2+input_num]]
-    output_wires = [int(x) for x in l[2+input_num:2+input_num+output_num]]
 
-    gate_type = l[-1]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert AGMPC circuits to visualizable format.")
+    parser.add_argument("in_file", help="Input file location")
+    parser.add_argument("output_file", help="Output file location")
+    parser.add_argument("--binary", action="store_true", help="Write the memory-mappable binary circuit format instead of JSON")
 
-    for ow in output_wires:
-        for gate in input_wire_map[ow]:
-            links.append({
-                "source": "GATE_"+gate_type+"_"+str(i+4),
-                "target": gate,
-                "value": 1
-            })
-
-graph = {
-    "nodes": nodes,
-    "links": links
-}
-
-with open(args.output_file, 'w') as outfile:
-    json.dump(graph, outfile)
+    args = parser.parse_args()
 
+    with open(args.in_file, 'r') as f:
+        if args.binary:
+            write_binary(convert(f, indexes=True), args.output_file)
+        else:
+            with open(args.output_file, 'w') as outfile:
+                write_json(convert(f), outfile)
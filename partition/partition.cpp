@@ -3,22 +3,22 @@
 #include <string>
 #include <vector>
 #include <map>
+#include <set>
+#include <sstream>
 #include <limits>
 #include <cmath>
 #include <unordered_set>
 #include <algorithm>
+#include <deque>
+#include <random>
 
 #include "boost/graph/adjacency_list.hpp"
 #include "boost/graph/graph_traits.hpp"
-#include "nlohmann/json.hpp"
 
-#define TMP_FILE "/tmp/hahaha_im_a_temp_file.json"
 #define AND_COST 8.0
 #define XOR_COST 2.0
 #define INV_COST 1.0
 
-using json = nlohmann::json;
-
 typedef boost::adjacency_list<boost::vecS, boost::vecS, boost::bidirectionalS> DirectedGraph;
 typedef std::pair<int, int> Edge;
 typedef boost::graph_traits<DirectedGraph>::vertex_iterator vertex_iter;
@@ -27,30 +27,10 @@ typedef boost::graph_traits<DirectedGraph>::in_edge_iterator in_edge_iter;
 
 static float cost_gamma = 1.5;
 
-float partition_cost(DirectedGraph &g, std::vector<std::unordered_set<int>> &partitions, float p_size, float g_size) {
-    float alpha = boost::num_edges(g) * (powf(partitions.size(), cost_gamma-1) / (powf(g_size, cost_gamma)));
+float partition_cost(float alpha, float p_size) {
     return alpha * powf(p_size, cost_gamma);
 }
 
-int num_edges_in_partition(DirectedGraph &g, std::unordered_set<int> &partition) {
-
-    int n_edges = 0;
-    std::unordered_set<int> partition_set(partition.begin(), partition.end());
-
-    for (auto n : partition) {
-        std::pair<out_edge_iter, out_edge_iter> op;
-        for (op = boost::out_edges(n, g); op.first != op.second; op.first++) { 
-            int source = boost::source(*op.first, g);
-            int target = boost::target(*op.first, g);
-            if (partition_set.find(source) != partition_set.end() && partition_set.find(target) != partition_set.end()) {
-                n_edges++;
-            }
-        }
-    }
-
-    return n_edges;
-}
-
 float weighted_gate_size(std::string name) {
     if (name.find("AND") != std::string::npos) {
         return AND_COST;
@@ -62,51 +42,41 @@ float weighted_gate_size(std::string name) {
     return 0;
 }
 
-float weighted_graph_size(std::map<int, std::string> &rev_node_map, DirectedGraph &g) {
-    float size = 0.0; 
-    std::pair<vertex_iter, vertex_iter> vp;
-    for(vp = boost::vertices(g); vp.first != vp.second; vp.first++) {
-        size += weighted_gate_size(rev_node_map[*vp.first]);
-    }
-    return size;
-}
+/*
+ * Change in the Fennel objective (edges inside partitions minus the size
+ * penalty) from adding vertex to a partition. Only the vertex's own edges
+ * and the partition's running size are involved. A partition of capacity c
+ * (1 on average) pays c * cost(size / c), so partitions fill in proportion
+ * to their capacity.
+ */
+float delta_g(DirectedGraph &graph, int vertex, int partition_idx, std::vector<std::unordered_set<int>> &partitions,
+              std::vector<float> &sizes, std::vector<float> &node_size, std::vector<float> &capacity, float alpha) {
 
-float weighted_partition_size(std::map<int, std::string> &rev_node_map, std::unordered_set<int> &p) {
-    float size = 0.0;
-    for (auto n : p) {
-        size += weighted_gate_size(rev_node_map[n]);
-    }
-    return size;
-}
+    std::unordered_set<int> &partition = partitions[partition_idx];
+    int n_neighbours = 0;
 
-float g(DirectedGraph &g, std::map<int, std::string> &rev_node_map, std::vector<std::unordered_set<int>> &partitions) {
-    float result = 0.0;
-    for (int i = 0; i < partitions.size(); i++) {
-        result += (num_edges_in_partition(g, partitions[i]) -
-                  partition_cost(g, partitions,
-                                 weighted_partition_size(rev_node_map, partitions[i]),
-                                 weighted_graph_size(rev_node_map, g)));
+    std::pair<in_edge_iter, in_edge_iter> ip;
+    for (ip = boost::in_edges(vertex, graph); ip.first != ip.second; ip.first++) {
+        if (partition.find(boost::source(*ip.first, graph)) != partition.end()) n_neighbours++;
+    }
+    std::pair<out_edge_iter, out_edge_iter> op;
+    for (op = boost::out_edges(vertex, graph); op.first != op.second; op.first++) {
+        if (partition.find(boost::target(*op.first, graph)) != partition.end()) n_neighbours++;
     }
-    return result;
-}
-
-float delta_g(DirectedGraph &graph, std::map<int, std::string> &rev_node_map, int vertex, int partition_idx, std::vector<std::unordered_set<int>> &partitions, float g_without_v) {
-
-    partitions[partition_idx].insert(vertex);
-    float g_with_v = g(graph, rev_node_map, partitions);
-    partitions[partition_idx].erase(vertex);
 
-    return g_with_v - g_without_v;
+    float p_size = sizes[partition_idx];
+    float cap = capacity[partition_idx];
+    return n_neighbours - cap * (partition_cost(alpha, (p_size + node_size[vertex]) / cap) - partition_cost(alpha, p_size / cap));
 }
 
-int vertex_assignment(DirectedGraph &graph, std::map<int, std::string> &rev_node_map, int vertex, std::vector<std::unordered_set<int>> &partitions) {
+int vertex_assignment(DirectedGraph &graph, int vertex, std::vector<std::unordered_set<int>> &partitions,
+                      std::vector<float> &sizes, std::vector<float> &node_size, std::vector<float> &capacity, float alpha) {
     
     int max_partition = 0;
     float max_dg = -std::numeric_limits<float>::max();
 
     for (int i = 0; i < partitions.size(); i++) {
-        float g_without_v = g(graph, rev_node_map, partitions);
-        float dg = delta_g(graph, rev_node_map, vertex, i, partitions, g_without_v);
+        float dg = delta_g(graph, vertex, i, partitions, sizes, node_size, capacity, alpha);
         if (dg > max_dg) {
             max_dg = dg;
             max_partition = i;
@@ -116,21 +86,168 @@ int vertex_assignment(DirectedGraph &graph, std::map<int, std::string> &rev_node
     return max_partition;
 }
 
-void fennel(DirectedGraph &g, std::map<int, std::string> &rev_node_map, std::vector<std::unordered_set<int>> &partitions) {
+bool is_io(std::map<int, std::string> &rev_node_map, int vertex) {
+    std::string node_name = rev_node_map[vertex];
+    return node_name.find("INPUT") != std::string::npos || node_name.find("OUTPUT") != std::string::npos;
+}
 
-    // Iterate through each vertex
+/*
+ * Order to stream the gates in: natural (file order), topo (by logic level),
+ * bfs/dfs (backwards from the output bits, gates no output depends on come
+ * last) or random (shuffled with seed).
+ */
+std::vector<int> stream_order(DirectedGraph &g, std::map<int, std::string> &rev_node_map, std::string order, unsigned seed) {
+    std::vector<int> gates;
     std::pair<vertex_iter, vertex_iter> vp;
     for(vp = boost::vertices(g); vp.first != vp.second; vp.first++) {
-        int vertex = *vp.first;
-        std::string node_name = rev_node_map[vertex];
+        if (!is_io(rev_node_map, *vp.first)) {
+            gates.push_back(*vp.first);
+        }
+    }
 
-        // Skip the partition assignment if it's just an input or output bit
-        if (node_name.find("INPUT") != std::string::npos || node_name.find("OUTPUT") != std::string::npos) {
-            continue;
+    if (order == "topo") {
+        // Gates come after their predecessors in vertex order
+        std::vector<int> level(boost::num_vertices(g), 0);
+        for (int v : gates) {
+            std::pair<in_edge_iter, in_edge_iter> ip;
+            for (ip = boost::in_edges(v, g); ip.first != ip.second; ip.first++) {
+                level[v] = std::max(level[v], level[boost::source(*ip.first, g)] + 1);
+            }
+        }
+        std::stable_sort(gates.begin(), gates.end(), [&level](int a, int b) { return level[a] < level[b]; });
+    } else if (order == "random") {
+        std::mt19937 rng(seed);
+        std::shuffle(gates.begin(), gates.end(), rng);
+    } else if (order == "bfs" || order == "dfs") {
+        std::vector<bool> seen(boost::num_vertices(g), false);
+        std::deque<int> frontier;
+        for(vp = boost::vertices(g); vp.first != vp.second; vp.first++) {
+            if (rev_node_map[*vp.first].find("OUTPUT") != std::string::npos) {
+                seen[*vp.first] = true;
+                frontier.push_back(*vp.first);
+            }
+        }
+        if (order == "dfs") {
+            std::reverse(frontier.begin(), frontier.end());
+        }
+
+        std::vector<int> visited;
+        while (!frontier.empty()) {
+            int v;
+            if (order == "bfs") {
+                v = frontier.front();
+                frontier.pop_front();
+            } else {
+                v = frontier.back();
+                frontier.pop_back();
+            }
+            if (!is_io(rev_node_map, v)) {
+                visited.push_back(v);
+            }
+
+            std::vector<int> preds;
+            std::pair<in_edge_iter, in_edge_iter> ip;
+            for (ip = boost::in_edges(v, g); ip.first != ip.second; ip.first++) {
+                preds.push_back(boost::source(*ip.first, g));
+            }
+            // A stack walks the first predecessor first
+            if (order == "dfs") {
+                std::reverse(preds.begin(), preds.end());
+            }
+            for (int pre : preds) {
+                if (!seen[pre]) {
+                    seen[pre] = true;
+                    frontier.push_back(pre);
+                }
+            }
+        }
+
+        for (int v : gates) {
+            if (!seen[v]) {
+                visited.push_back(v);
+            }
+        }
+        gates = visited;
+    }
+
+    return gates;
+}
+
+/*
+ * Stream the gates in order. With a lookahead of more than one, up to that
+ * many gates are buffered and the one with the most already placed
+ * neighbours (the earliest on ties) is placed next.
+ */
+void fennel(DirectedGraph &g, std::map<int, std::string> &rev_node_map, std::vector<std::unordered_set<int>> &partitions,
+            std::vector<int> &order, int lookahead, std::vector<float> &capacity) {
+
+    int n_vertices = boost::num_vertices(g);
+
+    // Running weighted size of each partition
+    std::vector<float> node_size(n_vertices);
+    float g_size = 0.0;
+    for (int v = 0; v < n_vertices; v++) {
+        node_size[v] = weighted_gate_size(rev_node_map[v]);
+        g_size += node_size[v];
+    }
+    std::vector<float> sizes(partitions.size(), 0.0);
+    float alpha = boost::num_edges(g) * (powf(partitions.size(), cost_gamma-1) / (powf(g_size, cost_gamma)));
+
+    auto add_to_partition = [&](int v, int partition_idx) {
+        if (partitions[partition_idx].insert(v).second) sizes[partition_idx] += node_size[v];
+    };
+
+    std::vector<bool> placed(n_vertices, false);
+    std::vector<bool> in_buffer(n_vertices, false);
+    std::vector<int> score(n_vertices, 0);
+    std::vector<int> buffer;
+    std::size_t next = 0;
+
+    auto neighbours = [&g](int v) -> std::vector<int> {
+        std::vector<int> result;
+        std::pair<in_edge_iter, in_edge_iter> ip;
+        for (ip = boost::in_edges(v, g); ip.first != ip.second; ip.first++) {
+            result.push_back(boost::source(*ip.first, g));
+        }
+        std::pair<out_edge_iter, out_edge_iter> op;
+        for (op = boost::out_edges(v, g); op.first != op.second; op.first++) {
+            result.push_back(boost::target(*op.first, g));
+        }
+        return result;
+    };
+
+    auto mark_placed = [&](int v) {
+        if (placed[v]) return;
+        placed[v] = true;
+        for (int n : neighbours(v)) {
+            if (in_buffer[n]) score[n]++;
         }
+    };
+
+    while (true) {
+        // Fill the buffer
+        while (buffer.size() < (std::size_t) std::max(lookahead, 1) && next < order.size()) {
+            int v = order[next++];
+            score[v] = 0;
+            for (int n : neighbours(v)) {
+                if (placed[n]) score[v]++;
+            }
+            in_buffer[v] = true;
+            buffer.push_back(v);
+        }
+        if (buffer.empty()) break;
+
+        std::size_t best = 0;
+        for (std::size_t i = 1; i < buffer.size(); i++) {
+            if (score[buffer[i]] > score[buffer[best]]) best = i;
+        }
+        int vertex = buffer[best];
+        buffer.erase(buffer.begin() + best);
+        in_buffer[vertex] = false;
 
-        int assignment = vertex_assignment(g, rev_node_map, vertex, partitions);
-        partitions[assignment].insert(vertex);
+        int assignment = vertex_assignment(g, vertex, partitions, sizes, node_size, capacity, alpha);
+        add_to_partition(vertex, assignment);
+        mark_placed(vertex);
 
         // Append any input bits to the same partition assignment
         std::pair<in_edge_iter, in_edge_iter> ip;
@@ -138,7 +255,8 @@ void fennel(DirectedGraph &g, std::map<int, std::string> &rev_node_map, std::vec
             int pre = boost::source(*ip.first, g);
             std::string pre_name = rev_node_map[pre];
             if (pre_name.find("INPUT") != std::string::npos) {
-                partitions[assignment].insert(pre);
+                add_to_partition(pre, assignment);
+                mark_placed(pre);
             }
         }
 
@@ -148,7 +266,8 @@ void fennel(DirectedGraph &g, std::map<int, std::string> &rev_node_map, std::vec
             int post = boost::target(*op.first, g);
             std::string post_name = rev_node_map[post];
             if (post_name.find("OUTPUT") != std::string::npos) {
-                partitions[assignment].insert(post);
+                add_to_partition(post, assignment);
+                mark_placed(post);
             }
         }
     }
@@ -185,6 +304,12 @@ void generate_output_files(std::string input_mpc_file, std::string output_direct
     full_out << header;
     for (auto& o : outs) o << header;
 
+    // gate -> partition
+    std::vector<int> gate_partition(boost::num_vertices(g), -1);
+    for (int i = 0; i < partitions.size(); i++) {
+        for (int n : partitions[i]) gate_partition[n] = i;
+    }
+
     // Track partition input/output wire numbers
     std::vector<std::set<int>> partition_input_wires(partitions.size());
     std::vector<std::set<int>> partition_output_wires(partitions.size());
@@ -218,21 +343,19 @@ void generate_output_files(std::string input_mpc_file, std::string output_direct
 
         // Figure out which partition the gate belongs to and write it to that file
         std::string gate_name = "GATE_" + gate_type + "_" + std::to_string(gate_line_number);
-        int gate_id = node_map[gate_name];
-        for (int i = 0; i < partitions.size(); i++) {
-            if (partitions[i].find(gate_id) != partitions[i].end()) {
-                for (int j = 0; j < num_gate_inputs; j++) {
-                    // Ignore actual input bits
-                    if (input_wires[j] >= num_a_inputs + num_b_inputs) {
-                        partition_input_wires[i].insert(input_wires[j]);   
-                    }
-                }
-                // Ignore actual output bits
-                if (output_wire < num_wires - num_outputs) {
-                    partition_output_wires[i].insert(output_wire);
+        int i = gate_partition[node_map[gate_name]];
+        if (i >= 0) {
+            for (int j = 0; j < num_gate_inputs; j++) {
+                // Ignore actual input bits
+                if (input_wires[j] >= num_a_inputs + num_b_inputs) {
+                    partition_input_wires[i].insert(input_wires[j]);   
                 }
-                outs[i] << gate_string;
             }
+            // Ignore actual output bits
+            if (output_wire < num_wires - num_outputs) {
+                partition_output_wires[i].insert(output_wire);
+            }
+            outs[i] << gate_string;
         }
 
         gate_line_number++;
@@ -268,55 +391,123 @@ void generate_output_files(std::string input_mpc_file, std::string output_direct
         std::cout << std::endl;
     }
 
+    // wire -> partition producing it, and the partitions reading it (in order)
+    std::vector<int> wire_producer(num_wires, -1);
+    std::vector<std::vector<int>> wire_consumers(num_wires);
+    for (int i = 0; i < partitions.size(); i++) {
+        for (int ow : partition_output_wires[i]) wire_producer[ow] = i;
+        for (int iw : partition_input_wires[i]) wire_consumers[iw].push_back(i);
+    }
+
     // Figure out where the wires are coming from / going to and write those to metadata
     for (int i = 0; i < partitions.size(); i++) {
         // Do all the inputs first
         for (int iw : incoming_wires[i]) {
-            for (int j = 0; j < partitions.size(); j++) {
-                for (int ow : partition_output_wires[j]) {
-                    if (ow == iw) {
-                        // <wire> <source>
-                        meta_outs[i] << iw << " " << j << "\n";
-                    }
-                }
+            if (wire_producer[iw] >= 0) {
+                // <wire> <source>
+                meta_outs[i] << iw << " " << wire_producer[iw] << "\n";
             }
         }
 
         // Now do the outputs
         for (int ow : outgoing_wires[i]) {
-            for (int j = 0; j < partitions.size(); j++) {
-                for (int iw : partition_input_wires[j]) {
-                    if (iw == ow) {
-                        // <wire> <source>
-                        meta_outs[i] << ow << " " << j << "\n";
-                    }
-                }
+            for (int j : wire_consumers[ow]) {
+                // <wire> <source>
+                meta_outs[i] << ow << " " << j << "\n";
+            }
+        }
+    }
+}
+
+/*
+ * Read an AGMPC circuit into the same graph mpc2graph.py builds: input bits,
+ * output bits, then gates named after their line number, and the links in
+ * the order they are found. Returns the number of nodes.
+ */
+int read_circuit(std::string input_mpc_file, std::vector<Edge> &edges,
+                 std::map<std::string, int> &node_map, std::map<int, std::string> &reverse_node_map) {
+
+    std::ifstream in(input_mpc_file);
+    if (!in) {
+        std::cerr << "ERROR: cannot open " << input_mpc_file << std::endl;
+        exit(1);
+    }
+
+    int num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs;
+    in >> num_gates >> num_wires >> num_a_inputs >> num_b_inputs >> num_outputs;
+
+    int id = 0;
+    auto add_node = [&](std::string name) {
+        node_map[name] = id;
+        reverse_node_map[id] = name;
+        return id++;
+    };
+
+    for (int i = 0; i < num_a_inputs; i++) add_node("INPUT_A_" + std::to_string(i));
+    for (int i = 0; i < num_b_inputs; i++) add_node("INPUT_B_" + std::to_string(i));
+    for (int i = 0; i < num_outputs; i++) add_node("OUTPUT_" + std::to_string(i));
+
+    // wire -> node driving it, and the gates that read it before that node showed up
+    std::vector<int> producers(num_wires, -1);
+    std::map<int, std::vector<int>> pending;
+    for (int w = 0; w < num_a_inputs + num_b_inputs && w < num_wires; w++) producers[w] = w;
+
+    int num_gate_inputs, num_gate_outputs;
+    int gate_line_number = 4;
+    std::string line;
+    while (std::getline(in, line)) {
+        std::istringstream gate_line(line);
+        if (!(gate_line >> num_gate_inputs >> num_gate_outputs)) continue;
+
+        std::vector<int> input_wires(num_gate_inputs), output_wires(num_gate_outputs);
+        for (auto &w : input_wires) gate_line >> w;
+        for (auto &w : output_wires) gate_line >> w;
+        std::string gate_type;
+        gate_line >> gate_type;
+
+        int gate = add_node("GATE_" + gate_type + "_" + std::to_string(gate_line_number));
+        gate_line_number++;
+
+        for (int iw : input_wires) {
+            if (producers[iw] >= 0) {
+                edges.push_back(Edge(producers[iw], gate));
+            } else {
+                pending[iw].push_back(gate);
+            }
+        }
+
+        for (int ow : output_wires) {
+            producers[ow] = gate;
+
+            auto it = pending.find(ow);
+            if (it != pending.end()) {
+                for (int target : it->second) edges.push_back(Edge(gate, target));
+                pending.erase(it);
+            }
+
+            if (ow >= num_wires - num_outputs) {
+                edges.push_back(Edge(gate, node_map["OUTPUT_" + std::to_string(ow - (num_wires - num_outputs))]));
             }
         }
     }
+
+    return id;
 }
 
 /*
  * Usage: ./partition <input raw MPC circuit> <directory for output circuit files> <num partitions> <gamma (optional)>
+ *                    <stream order (optional)> <lookahead (optional)> <seed (optional)>
+ *                    <node capacities (optional, comma separated, one per partition)>
  */
 int main(int argc, char *argv[]) {
 
     if (argc < 4) {
-        std::cout << "Usage: ./partition <input raw MPC circuit> <output directory> <num partitions> [gamma]" << std::endl;
+        std::cout << "Usage: ./partition <input raw MPC circuit> <output directory> <num partitions> [gamma] [natural|topo|bfs|dfs|random] [lookahead] [seed] [capacities]" << std::endl;
         return 1;
     }
 
-    // Arg 1: input MPC file, representing circuit, need to parse to JSON
+    // Arg 1: input MPC file
     std::string input_mpc_file(argv[1]);
-    std::string convert_command = "python3 mpc2graph.py ";
-    convert_command += input_mpc_file + " " + TMP_FILE;
-
-    std::cout << "Converting raw circuit file: " << convert_command << std::endl;
-    system(convert_command.c_str());
-
-    std::ifstream i(TMP_FILE);
-    json graph_json;
-    i >> graph_json;
 
     // Arg 2: output directory
     std::string output_directory(argv[2]);
@@ -331,30 +522,64 @@ int main(int argc, char *argv[]) {
         cost_gamma = atof(argv[4]);
         std::cout << "Fennel gamma specified: " << cost_gamma << std::endl;
     }
-    
-    // Assign unique node ID to each input/gate/output
-    std::cout << "Generating node maps." << std::endl;
-    std::map<std::string, int> node_map;
-    std::map<int, std::string> reverse_node_map;
 
-    int id = 0;
-    for (auto& node : graph_json["nodes"]) {
-        node_map[node["id"]] = id;
-        reverse_node_map[id] = node["id"];
-        id++;
+    // Arg 5: optional stream order
+    std::string order = "natural";
+    if (argc >= 6) {
+        order = argv[5];
+        if (order != "natural" && order != "topo" && order != "bfs" && order != "dfs" && order != "random") {
+            std::cerr << "Unknown stream order: " << order << std::endl;
+            return 1;
+        }
+        std::cout << "Stream order: " << order << std::endl;
     }
 
-    // Create graph
-    std::cout << "Generating graph." << std::endl;
-    std::vector<Edge> edgeVec;
-    for (auto& link : graph_json["links"]) {
-        edgeVec.push_back(Edge(node_map[link["source"]], node_map[link["target"]]));
+    // Arg 6: optional lookahead buffer size
+    int lookahead = 0;
+    if (argc >= 7) {
+        lookahead = atoi(argv[6]);
+        std::cout << "Lookahead buffer: " << lookahead << std::endl;
+    }
+
+    // Arg 7: optional seed for the random order
+    unsigned seed = 0;
+    if (argc >= 8) {
+        seed = strtoul(argv[7], NULL, 10);
+    }
+
+    // Arg 8: optional relative node capacities, e.g. 1,2,1
+    std::vector<float> capacity(n_partitions, 1.0);
+    if (argc >= 9) {
+        std::vector<float> given;
+        std::stringstream ss(argv[8]);
+        std::string item;
+        while (std::getline(ss, item, ',')) {
+            given.push_back(atof(item.c_str()));
+        }
+        if (given.size() != (std::size_t) n_partitions || *std::min_element(given.begin(), given.end()) <= 0) {
+            std::cerr << "Need " << n_partitions << " positive node capacities" << std::endl;
+            return 1;
+        }
+
+        // Scale to an average of 1, so equal capacities change nothing
+        float total = 0.0;
+        for (float x : given) total += x;
+        for (int i = 0; i < n_partitions; i++) capacity[i] = given[i] * n_partitions / total;
+        std::cout << "Node capacities: " << argv[8] << std::endl;
     }
-    DirectedGraph g(edgeVec.begin(), edgeVec.end(), graph_json["nodes"].size());
+    
+    // Assign unique node ID to each input/gate/output and create the graph
+    std::cout << "Reading circuit: " << input_mpc_file << std::endl;
+    std::map<std::string, int> node_map;
+    std::map<int, std::string> reverse_node_map;
+    std::vector<Edge> edgeVec;
+    int n_nodes = read_circuit(input_mpc_file, edgeVec, node_map, reverse_node_map);
+    DirectedGraph g(edgeVec.begin(), edgeVec.end(), n_nodes);
 
     std::cout << "Partitioning...";
     std::vector<std::unordered_set<int>> partitions(n_partitions);
-    fennel(g, reverse_node_map, partitions);
+    std::vector<int> stream = stream_order(g, reverse_node_map, order, seed);
+    fennel(g, reverse_node_map, partitions, stream, lookahead, capacity);
     std::cout << " done." << std::endl;
 
     // Output circuit files
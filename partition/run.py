@@ -0,0 +1,288 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from array import array
+from multiprocessing.connection import wait
+
+from mpc2graph import read_gates, read_header
+
+# Seconds to wait for the partitions to read their circuits, and then for
+# each next partition to finish
+TIMEOUT = 60.0
+
+
+def read_circuit(path):
+    """(header, gates) of a circuit file, each gate as (input wires, output
+    wire, type)."""
+    with open(path, 'r') as f:
+        header = read_header(f)
+        gates = [(input_wires, output_wires[0], gate_type) for _, input_wires, output_wires, gate_type in read_gates(f)]
+    return header, gates
+
+
+def read_routes(directory, name):
+    """Wires each partition sends, from the meta files: {partition: {wire:
+    [partitions to send it to]}}. The incoming lists are used, they name
+    every wire a partition reads from elsewhere and who produces it.
+    """
+    metas = glob.glob(os.path.join(directory, name + "-*-meta.txt"))
+    n_partitions = len(metas)
+
+    sends = {i: {} for i in range(n_partitions)}
+    for path in metas:
+        with open(path, 'r') as f:
+            j, n_incoming, n_outgoing = [int(x) for x in f.readline().split()]
+            for k in range(n_incoming):
+                wire, i = [int(x) for x in f.readline().split()]
+                sends[i].setdefault(wire, []).append(j)
+
+    return n_partitions, sends
+
+
+def evaluate(gates, values):
+    for input_wires, out, gate_type in gates:
+        if gate_type == "AND":
+            values[out] = values[input_wires[0]] & values[input_wires[1]]
+        elif gate_type == "XOR":
+            values[out] = values[input_wires[0]] ^ values[input_wires[1]]
+        elif gate_type == "INV":
+            values[out] = values[input_wires[0]] ^ 1
+        else:
+            raise ValueError("Unknown gate type " + gate_type)
+
+
+def input_values(num_wires, num_a_inputs, num_b_inputs, a, b):
+    values = bytearray(num_wires)
+    for w in range(num_a_inputs):
+        values[w] = (a >> w) & 1
+    for w in range(num_b_inputs):
+        values[num_a_inputs + w] = (b >> w) & 1
+    return values
+
+
+def pack(wires, values):
+    # Wire numbers, then one byte per wire value
+    return array('i', wires).tobytes() + bytes(values[w] for w in wires)
+
+
+def unpack(payload):
+    n = len(payload) // 5
+    return array('i', payload[:4 * n]), payload[4 * n:]
+
+
+def receiver(conns, inbox):
+    # Drains the incoming pipes, so a partition never blocks sending to a
+    # partition that is itself blocked sending
+    conns = list(conns)
+    while conns:
+        for conn in wait(conns):
+            try:
+                inbox.put(conn.recv_bytes())
+            except EOFError:
+                conns.remove(conn)
+    inbox.put(None)
+
+
+def worker(i, path, sends, send_conns, recv_conns, a, b, eager, barrier, results):
+    try:
+        (num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs), gates = read_circuit(path)
+    except Exception:
+        # Lets everyone waiting at the barrier know straight away
+        barrier.abort()
+        raise
+    values = input_values(num_wires, num_a_inputs, num_b_inputs, a, b)
+    have = bytearray(num_wires)
+    for w in range(num_a_inputs + num_b_inputs):
+        have[w] = 1
+
+    inbox = queue.Queue()
+    threading.Thread(target=receiver, args=(recv_conns, inbox), daemon=True).start()
+
+    pending = {j: [] for j in send_conns}
+    stats = {"gates": len(gates), "messages": 0, "bytes": 0, "wires": 0, "waiting": 0.0}
+
+    def flush():
+        for j, wires in pending.items():
+            if wires:
+                payload = pack(wires, values)
+                send_conns[j].send_bytes(payload)
+                stats["messages"] += 1
+                stats["bytes"] += len(payload)
+                stats["wires"] += len(wires)
+                pending[j] = []
+
+    def receive():
+        # Everything produced so far goes out before waiting, which is what
+        # keeps the partitions from waiting on each other in a cycle
+        flush()
+        start = time.perf_counter()
+        payload = inbox.get()
+        stats["waiting"] += time.perf_counter() - start
+        if payload is None:
+            raise RuntimeError("partition " + str(i) + " is missing an input wire")
+
+        wires, wire_values = unpack(payload)
+        for w, v in zip(wires, wire_values):
+            values[w] = v
+            have[w] = 1
+
+    barrier.wait()
+
+    for input_wires, out, gate_type in gates:
+        for w in input_wires:
+            while not have[w]:
+                receive()
+
+        evaluate([(input_wires, out, gate_type)], values)
+        have[out] = 1
+
+        for j in sends.get(out, ()):
+            pending[j].append(out)
+        if eager:
+            flush()
+
+    flush()
+    stats["end"] = time.perf_counter()
+
+    outputs = {w: values[w] for w in range(num_wires - num_outputs, num_wires) if have[w]}
+    results.put((i, stats, outputs))
+
+
+def run(directory, name, a, b, eager=False, timeout=TIMEOUT):
+    """Evaluate a partitioned circuit with one process per partition.
+
+    Partition i evaluates <name>-i.txt in plaintext, in file order, and the
+    wires other partitions read from it go to them over pipes. Wires are
+    sent in one message per destination whenever the partition has to wait
+    for a wire itself (or is done), or one message per wire with eager.
+    The clock starts once every process has read its circuit.
+
+    Raises RuntimeError if a partition fails, if the partitions take longer
+    than timeout seconds to read their circuits, or if none finishes for
+    timeout seconds (a wire that never arrives); the processes are then
+    stopped.
+
+    Returns (seconds, output bits, per-partition stats).
+    """
+    n_partitions, sends = read_routes(directory, name)
+    if not n_partitions:
+        raise ValueError("No partitions of " + name + " in " + directory)
+
+    ctx = multiprocessing.get_context("spawn")
+    send_conns = {i: {} for i in range(n_partitions)}
+    recv_conns = {j: [] for j in range(n_partitions)}
+    for i in range(n_partitions):
+        for j in sorted(set(j for dests in sends[i].values() for j in dests)):
+            r, w = ctx.Pipe(duplex=False)
+            send_conns[i][j] = w
+            recv_conns[j].append(r)
+
+    barrier = ctx.Barrier(n_partitions + 1)
+    results = ctx.Queue()
+    processes = []
+    for i in range(n_partitions):
+        path = os.path.join(directory, name + "-" + str(i) + ".txt")
+        p = ctx.Process(target=worker, args=(i, path, sends[i], send_conns[i], recv_conns[i], a, b, eager, barrier, results),
+                        daemon=True)
+        p.start()
+        processes.append(p)
+
+    # Spawned children only hold their own pipe ends, so once the parent's
+    # copies are closed a finished partition's readers see the end
+    for conns in send_conns.values():
+        for conn in conns.values():
+            conn.close()
+    for conns in recv_conns.values():
+        for conn in conns:
+            conn.close()
+
+    try:
+        waited = time.perf_counter()
+        try:
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            # A worker breaks the barrier early when it cannot read its file
+            if time.perf_counter() - waited < timeout:
+                raise RuntimeError("a partition failed to read its circuit")
+            raise RuntimeError("the partitions did not read their circuits in {:g} s".format(timeout))
+        start = time.perf_counter()
+
+        stats = [None for i in range(n_partitions)]
+        outputs = {}
+        for k in range(n_partitions):
+            deadline = time.perf_counter() + timeout
+            while True:
+                try:
+                    i, s, o = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    if any(p.exitcode for p in processes):
+                        raise RuntimeError("a partition failed")
+                    if time.perf_counter() > deadline:
+                        raise RuntimeError("no partition finished in {:g} s, one is waiting for a wire that is never sent".format(timeout))
+            stats[i] = s
+            outputs.update(o)
+
+        for p in processes:
+            p.join(timeout)
+            if p.exitcode != 0:
+                raise RuntimeError("a partition failed")
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+
+    seconds = max(s["end"] for s in stats) - start
+    return seconds, [outputs[w] for w in sorted(outputs)], stats
+
+
+def bits_value(bits):
+    return sum(v << k for k, v in enumerate(bits))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate partitioned circuit files in plaintext, one local process per partition.")
+    parser.add_argument("directory", help="Folder with the partition binary's (or emit.py's) output files")
+    parser.add_argument("name", help="Circuit name, the raw circuit file name without .txt")
+    parser.add_argument("--a", type=int, default=None, help="Party A's input, bit i on input wire i (default: random)")
+    parser.add_argument("--b", type=int, default=None, help="Party B's input (default: random)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the inputs")
+    parser.add_argument("--eager", action="store_true", help="Send every wire as soon as it is computed")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="Seconds to wait for the next partition to finish before giving up")
+
+    args = parser.parse_args()
+
+    full_path = os.path.join(args.directory, args.name + ".txt")
+    (num_gates, num_wires, num_a_inputs, num_b_inputs, num_outputs), gates = read_circuit(full_path)
+
+    rng = random.Random(args.seed)
+    a = rng.getrandbits(max(num_a_inputs, 1)) if args.a is None else args.a
+    b = rng.getrandbits(max(num_b_inputs, 1)) if args.b is None else args.b
+
+    seconds, outputs, stats = run(args.directory, args.name, a, b, args.eager, args.timeout)
+
+    # The whole circuit in this process, for the expected output and a baseline
+    values = input_values(num_wires, num_a_inputs, num_b_inputs, a, b)
+    start = time.perf_counter()
+    evaluate(gates, values)
+    single = time.perf_counter() - start
+    expected = list(values[num_wires - num_outputs:])
+
+    print("Partitions:", len(stats))
+    print("Latency: {:.2f} ms (one process: {:.2f} ms)".format(1000 * seconds, 1000 * single))
+    print("Messages:", sum(s["messages"] for s in stats), "| bytes:", sum(s["bytes"] for s in stats),
+          "| wires:", sum(s["wires"] for s in stats))
+    for i, s in enumerate(stats):
+        print("\t{}) {} gates, {} messages, {} bytes, {:.2f} ms waiting".format(
+            i, s["gates"], s["messages"], s["bytes"], 1000 * s["waiting"]))
+    print("Output:", bits_value(outputs))
+
+    if outputs != expected:
+        print("ERROR: outputs differ from the unpartitioned circuit's", bits_value(expected), file=sys.stderr)
+        sys.exit(1)
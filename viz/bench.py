@@ -0,0 +1,306 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import circuit
+import stats
+import sweep
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO, "partition"))
+import emit
+import mpc2graph
+
+CIRCUITS = [
+    os.path.join(REPO, "circuits", "adder_32bit.txt"),
+    os.path.join(REPO, "viz", "raw_circuits", "sort.txt"),
+]
+PARTITIONS = [2, 4, 8]
+ALGORITHMS = ["fennel", "fennel-volume", "multilevel", "critical-path"]
+
+# Results to compare against by default, saved with --out
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Wall time and memory changes smaller than these are noise
+MIN_SECONDS = 0.05
+MIN_KB = 1024
+
+
+def base_args():
+    # Everything sweep.config_args does not set
+    return argparse.Namespace(and_cost=8, xor_cost=2, inv_cost=1, passes=1, converge="cut",
+                              order="natural", lookahead=0, seed=None, memory_budget=None,
+                              node_speed=None, node_capacity=None,
+                              latency=0, msg_overhead=0, bandwidth=0, batch_window=0)
+
+
+# Stages run in a fresh process each and return (seconds, metrics); only the
+# work being measured is inside the timer, loading is not
+
+def stage_convert(raw, json_path):
+    start = time.perf_counter()
+    with open(raw, 'r') as f, open(json_path, 'w') as out:
+        mpc2graph.write_json(mpc2graph.convert(f), out)
+    return time.perf_counter() - start, {}
+
+
+def stage_load(json_path):
+    start = time.perf_counter()
+    c = circuit.load(json_path, cache=False)
+    return time.perf_counter() - start, {"nodes": c.n_nodes, "edges": c.n_edges}
+
+
+def stage_partition(json_path, base, algorithm, k, gamma, out_path):
+    c = circuit.load(json_path, cache=False)
+    args = sweep.config_args(base, {"gamma": gamma, "clusters": k, "algorithm": algorithm})
+
+    start = time.perf_counter()
+    groups = sweep.partition(c, args, algorithm)
+    seconds = time.perf_counter() - start
+
+    circuit.dump(c, out_path, groups)
+    return seconds, {}
+
+
+def stage_stats(part_path):
+    c = circuit.load(part_path, cache=False)
+    args = argparse.Namespace(verbose=True)
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as out:
+        stats.stats(args, c, out)
+    seconds = time.perf_counter() - start
+
+    return seconds, {"cut": len(stats.cross_cluster_edges(c)[0]),
+                     "volume": sum(stats.communication_volume(c).values())}
+
+
+def stage_rough_sim(part_path, distributed):
+    c = circuit.load(part_path, cache=False)
+    if distributed:
+        clusters, n_clusters = np.maximum(c.groups, 0), stats.cluster_count(c)
+    else:
+        clusters, n_clusters = np.zeros(c.n_nodes, dtype=np.int32), 1
+
+    start = time.perf_counter()
+    ticks = stats.simulate(c, clusters, n_clusters)
+    return time.perf_counter() - start, {"ticks": ticks}
+
+
+def stage_emit(raw, part_path, out_dir, k):
+    with open(part_path, 'r') as f:
+        groups = {n["id"]: n["group"] for n in json.load(f)["nodes"]}
+
+    start = time.perf_counter()
+    emit.emit(raw, groups, out_dir, k)
+    return time.perf_counter() - start, {}
+
+
+def stage_idle():
+    # Nothing, for the memory of a stage process before it does any work
+    return 0.0, {}
+
+
+def _measure(job):
+    fn, fn_args = job
+    seconds, metrics = fn(*fn_args)
+    # Kilobytes on Linux
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, metrics
+
+
+def measure(fn, *fn_args, repeat=1):
+    """Run a stage in new processes, keeping the fastest of repeat runs and
+    the peak RSS of that process."""
+    best = None
+    ctx = multiprocessing.get_context("spawn")
+    for i in range(repeat):
+        with ctx.Pool(1) as pool:
+            result = pool.apply(_measure, ((fn, fn_args),))
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def peak_rss(pid):
+    # High-water RSS of the running process, in KB
+    try:
+        with open("/proc/" + str(pid) + "/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def measure_binary(binary, raw, out_dir, k, gamma, repeat=1):
+    """Time the C++ partitioner. Its peak RSS is sampled from /proc while it
+    runs, since the rusage of a child also counts the memory of the Python
+    process it was forked from; very short runs may report none.
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        p = subprocess.Popen([binary, raw, out_dir, str(k), str(gamma)], cwd=os.path.dirname(binary),
+                             stdout=subprocess.DEVNULL)
+        rss = None
+        while p.poll() is None:
+            rss = peak_rss(p.pid) or rss
+            time.sleep(0.001)
+        seconds = time.perf_counter() - start
+
+        if p.returncode != 0:
+            raise RuntimeError(binary + " failed on " + raw)
+        if best is None or seconds < best[0]:
+            best = (seconds, rss)
+
+    # Wires sent: the incoming counts on the first line of each meta file
+    name = os.path.splitext(os.path.basename(raw))[0]
+    volume = 0
+    for i in range(k):
+        with open(os.path.join(out_dir, name + "-" + str(i) + "-meta.txt"), 'r') as f:
+            volume += int(f.readline().split()[1])
+
+    return best[0], best[1], {"volume": volume}
+
+
+def record(rows, circuit_name, stage, algorithm, k, result, idle_kb=0):
+    """Add a result row. rss_kb is the peak RSS over idle_kb, the peak of a
+    stage process that does nothing, so it is the memory the stage itself
+    added rather than mostly the interpreter and its imports."""
+    seconds, rss, metrics = result
+    row = {"circuit": circuit_name, "stage": stage, "algorithm": algorithm, "partitions": k,
+           "seconds": round(seconds, 4), "peak_rss_kb": rss,
+           "rss_kb": None if rss is None else max(rss - idle_kb, 0)}
+    row.update(metrics)
+    rows.append(row)
+    print(format_row(row))
+    sys.stdout.flush()
+
+
+def format_row(row):
+    extra = " ".join(k + "=" + str(row[k]) for k in ("nodes", "edges", "cut", "volume", "ticks") if k in row)
+    return "{:<12} {:<10} {:<14} {:>3} {:>9.3f}s {:>9} KB  {}".format(
+        row["circuit"], row["stage"], row["algorithm"], row["partitions"], row["seconds"],
+        "-" if row["rss_kb"] is None else "+" + str(row["rss_kb"]), extra)
+
+
+def run(args):
+    rows = []
+    base = base_args()
+
+    idle = measure(stage_idle)[1]
+    print("Idle stage process: {} KB peak RSS, stage memory below is on top of it".format(idle))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for raw in args.circuits:
+            name = os.path.splitext(os.path.basename(raw))[0]
+            json_path = os.path.join(tmp, name + ".json")
+
+            record(rows, name, "convert", "-", 0, measure(stage_convert, raw, json_path, repeat=args.repeat), idle)
+            record(rows, name, "load", "-", 0, measure(stage_load, json_path, repeat=args.repeat), idle)
+            record(rows, name, "rough_sim", "central", 1, measure(stage_rough_sim, json_path, False, repeat=args.repeat), idle)
+
+            for k in args.partitions:
+                for algorithm in args.algorithms:
+                    part_path = os.path.join(tmp, name + "-" + algorithm + "-" + str(k) + ".json")
+                    out_dir = os.path.join(tmp, name + "-" + algorithm + "-" + str(k))
+                    os.mkdir(out_dir)
+
+                    record(rows, name, "partition", algorithm, k,
+                           measure(stage_partition, json_path, base, algorithm, k, args.gamma, part_path, repeat=args.repeat), idle)
+                    record(rows, name, "stats", algorithm, k, measure(stage_stats, part_path, repeat=args.repeat), idle)
+                    record(rows, name, "rough_sim", algorithm, k, measure(stage_rough_sim, part_path, True, repeat=args.repeat), idle)
+                    record(rows, name, "emit", algorithm, k, measure(stage_emit, raw, part_path, out_dir, k, repeat=args.repeat), idle)
+
+                if args.binary:
+                    out_dir = os.path.join(tmp, name + "-binary-" + str(k))
+                    os.mkdir(out_dir)
+                    record(rows, name, "partition", "partition.cpp", k,
+                           measure_binary(os.path.abspath(args.binary), os.path.abspath(raw), out_dir, k, args.gamma, args.repeat))
+
+    return rows
+
+
+def row_key(row):
+    return (row["circuit"], row["stage"], row["algorithm"], row["partitions"])
+
+
+def compare(rows, baseline, tolerance):
+    """Print how each measurement moved against the baseline. Returns the
+    number of regressions: more than tolerance slower or bigger."""
+    old = {row_key(r): r for r in baseline}
+    regressions = 0
+
+    print("\n--- Against baseline ---")
+    for row in rows:
+        base = old.get(row_key(row))
+        if base is None:
+            continue
+
+        notes = []
+        if abs(row["seconds"] - base["seconds"]) >= MIN_SECONDS:
+            ratio = row["seconds"] / max(base["seconds"], 1e-9)
+            if ratio > 1 + tolerance:
+                notes.append("SLOWER x{:.2f}".format(ratio))
+                regressions += 1
+            elif ratio < 1 / (1 + tolerance):
+                notes.append("faster x{:.2f}".format(1 / ratio))
+
+        if row["rss_kb"] is not None and base.get("rss_kb") is not None and abs(row["rss_kb"] - base["rss_kb"]) >= MIN_KB:
+            ratio = row["rss_kb"] / max(base["rss_kb"], 1)
+            if ratio > 1 + tolerance:
+                notes.append("MORE MEMORY x{:.2f}".format(ratio))
+                regressions += 1
+            elif ratio < 1 / (1 + tolerance):
+                notes.append("less memory x{:.2f}".format(1 / ratio))
+
+        for k in ("cut", "volume", "ticks"):
+            if k in row and k in base and row[k] != base[k]:
+                notes.append(k + " " + str(base[k]) + " -> " + str(row[k]))
+
+        if notes:
+            print(" ".join(str(x) for x in row_key(row)) + ": " + ", ".join(notes))
+
+    print(regressions, "regression(s)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and measure each stage of the partition and simulation pipeline")
+    parser.add_argument("circuits", nargs="*", default=CIRCUITS, help="Raw MPC circuit files (default: adder_32bit and sort)")
+    parser.add_argument("--partitions", type=int, nargs="+", default=PARTITIONS, help="Partition counts")
+    parser.add_argument("--algorithms", nargs="+", choices=sweep.ALGORITHMS, default=ALGORITHMS, help="Partitioners to run")
+    parser.add_argument("--gamma", type=float, default=4, help="Fennel gamma")
+    parser.add_argument("--binary", help="Also time this build of partition/partition")
+    parser.add_argument("--repeat", type=int, default=1, help="Keep the fastest of this many runs of each stage")
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE, help="Compare against results saved with --out (default: bench_baseline.json next to this script, '' for none)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction slower or bigger than the baseline that counts as a regression")
+
+    args = parser.parse_args()
+
+    # Read before running, --out may replace it
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    elif args.baseline and args.baseline != BASELINE:
+        parser.error("No baseline at " + args.baseline)
+
+    rows = run(args)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(rows, f, indent=1)
+
+    if baseline is not None and compare(rows, baseline, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,349 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+# Gate type codes, stored as uint8 so that the hot loops never look at names
+INPUT = 0
+OUTPUT = 1
+AND = 2
+XOR = 3
+INV = 4
+OTHER = 5
+
+GATE_TYPE_NAMES = ["INPUT", "OUTPUT", "AND", "XOR", "INV", "OTHER"]
+
+
+def gate_type(name):
+    if "INPUT" in name:
+        return INPUT
+    elif "OUTPUT" in name:
+        return OUTPUT
+    elif "AND" in name:
+        return AND
+    elif "XOR" in name:
+        return XOR
+    elif "INV" in name:
+        return INV
+
+    return OTHER
+
+
+def _csr(keys, values, n):
+    # Stable sort keeps the original link order within each row, which is
+    # the order networkx used to hand out successors/predecessors
+    order = np.argsort(keys, kind="stable")
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=ptr[1:])
+    return ptr, values[order].astype(np.int32), order
+
+
+class NameTable:
+    """Node names packed into one UTF-8 buffer, name i is data[ptr[i]:ptr[i+1]]."""
+
+    def __init__(self, ptr, data):
+        self.ptr = ptr
+        self.data = data
+
+    @classmethod
+    def from_list(cls, names):
+        encoded = [n.encode() for n in names]
+        ptr = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(n) for n in encoded], out=ptr[1:])
+        return cls(ptr, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.ptr) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.ptr[i]:self.ptr[i+1]].tobytes().decode()
+
+    def __iter__(self):
+        data = self.data.tobytes()
+        ptr = self.ptr.tolist()
+        for i in range(len(ptr) - 1):
+            yield data[ptr[i]:ptr[i+1]].decode()
+
+
+class Circuit:
+    """Integer-indexed circuit DAG.
+
+    Node i has name names[i], gate type types[i] and partition groups[i]
+    (-1 if unassigned). Edges are kept twice in CSR form: the successors of
+    i are succ_idx[succ_ptr[i]:succ_ptr[i+1]] and the predecessors are
+    pred_idx[pred_ptr[i]:pred_ptr[i+1]]. succ_wire, if known, is the circuit
+    wire number each successor edge carries.
+    """
+
+    def __init__(self, names, types, groups, succ_ptr, succ_idx, succ_weight, pred_ptr, pred_idx, succ_wire=None):
+        self.names = names
+        self.types = types
+        self.groups = groups
+        self.succ_ptr = succ_ptr
+        self.succ_idx = succ_idx
+        self.succ_weight = succ_weight
+        self.pred_ptr = pred_ptr
+        self.pred_idx = pred_idx
+        self.succ_wire = succ_wire
+
+    @property
+    def n_nodes(self):
+        return len(self.types)
+
+    @property
+    def n_edges(self):
+        return len(self.succ_idx)
+
+    def successors(self, v):
+        return self.succ_idx[self.succ_ptr[v]:self.succ_ptr[v+1]]
+
+    def predecessors(self, v):
+        return self.pred_idx[self.pred_ptr[v]:self.pred_ptr[v+1]]
+
+    def neighbors(self, v):
+        return np.concatenate((self.predecessors(v), self.successors(v)))
+
+    def edge_sources(self):
+        return np.repeat(np.arange(self.n_nodes, dtype=np.int32), np.diff(self.succ_ptr))
+
+    def edges(self):
+        return self.edge_sources(), self.succ_idx
+
+    def wires(self):
+        # All edges out of a node carry its one output wire, so without wire
+        # numbers the source node stands in for the wire
+        if self.succ_wire is None:
+            return self.edge_sources().astype(np.int64)
+        return self.succ_wire
+
+    def with_groups(self, groups):
+        return Circuit(self.names, self.types, np.asarray(groups, dtype=np.int32),
+                       self.succ_ptr, self.succ_idx, self.succ_weight,
+                       self.pred_ptr, self.pred_idx, self.succ_wire)
+
+    def prefix(self, m):
+        """Subcircuit of the first m nodes and the edges between them."""
+        if isinstance(self.names, NameTable):
+            names = NameTable(self.names.ptr[:m+1], self.names.data)
+        else:
+            names = self.names[:m]
+
+        sources, targets = self.edges()
+        keep = (sources < m) & (targets < m)
+        wires = None if self.succ_wire is None else self.succ_wire[keep]
+        return from_edges(names, self.types[:m], self.groups[:m],
+                          sources[keep], targets[keep], self.succ_weight[keep], wires)
+
+    def gate_mask(self):
+        return (self.types == AND) | (self.types == XOR) | (self.types == INV)
+
+    def index(self):
+        return {n: i for i, n in enumerate(self.names)}
+
+
+def from_edges(names, types, groups, sources, targets, weights=None, wires=None):
+    n = len(names)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    if weights is None:
+        weights = np.ones(len(sources), dtype=np.int32)
+    weights = np.asarray(weights, dtype=np.int32)
+
+    # Drop parallel links (e.g. a gate reading the same wire twice)
+    _, first = np.unique(sources * n + targets, return_index=True)
+    keep = np.sort(first)
+    sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+    succ_ptr, succ_idx, order = _csr(sources, targets, n)
+    pred_ptr, pred_idx, _ = _csr(targets, sources, n)
+
+    if wires is not None:
+        wires = np.asarray(wires, dtype=np.int64)[keep][order]
+
+    return Circuit(names,
+                   np.asarray(types, dtype=np.uint8),
+                   np.asarray(groups, dtype=np.int32),
+                   succ_ptr, succ_idx, weights[order],
+                   pred_ptr, pred_idx, wires)
+
+
+def from_json(graph):
+    names = [n["id"] for n in graph["nodes"]]
+    types = [gate_type(n) for n in names]
+    groups = [n["group"] if isinstance(n.get("group"), int) else -1 for n in graph["nodes"]]
+
+    node_idx = {n: i for i, n in enumerate(names)}
+    sources = [node_idx[l["source"]] for l in graph["links"]]
+    targets = [node_idx[l["target"]] for l in graph["links"]]
+    weights = [l.get("value", 1) for l in graph["links"]]
+
+    wires = None
+    if graph["links"] and all("wire" in l for l in graph["links"]):
+        wires = [l["wire"] for l in graph["links"]]
+
+    return from_edges(names, types, groups, sources, targets, weights, wires)
+
+
+# Binary format: MAGIC, a little-endian uint64 header length, a JSON header
+# mapping array name -> [dtype, length, offset], then the raw arrays, each
+# starting on an ALIGN boundary so they can be mapped in place
+MAGIC = b"DCIRC001"
+ALIGN = 64
+BINARY_EXT = ".circ"
+
+_BINARY_ARRAYS = ["types", "groups", "succ_ptr", "succ_idx", "succ_weight", "pred_ptr", "pred_idx"]
+
+
+def save_binary(circuit, path):
+    names = circuit.names
+    if not isinstance(names, NameTable):
+        names = NameTable.from_list(names)
+
+    arrays = [(a, getattr(circuit, a)) for a in _BINARY_ARRAYS]
+    if circuit.succ_wire is not None:
+        arrays.append(("succ_wire", circuit.succ_wire))
+    arrays += [("name_ptr", names.ptr), ("name_data", names.data)]
+
+    layout = {}
+    offset = 0
+    for name, a in arrays:
+        a = np.asarray(a)
+        layout[name] = [a.dtype.str, len(a), offset]
+        offset += -(-a.nbytes // ALIGN) * ALIGN
+
+    header = json.dumps(layout).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, a in arrays:
+            f.seek(start + layout[name][2])
+            np.ascontiguousarray(a).tofile(f)
+        f.truncate(start + offset)
+
+
+def load_binary(path):
+    """Memory-map a binary circuit; the arrays are read-only views of the file."""
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError(path + " is not a binary circuit file")
+
+    header_len, = struct.unpack_from("<Q", buf, len(MAGIC))
+    header = json.loads(buf[len(MAGIC) + 8:len(MAGIC) + 8 + header_len])
+    start = -(-(len(MAGIC) + 8 + header_len) // ALIGN) * ALIGN
+
+    arrays = {}
+    for name, (dtype, length, offset) in header.items():
+        arrays[name] = np.frombuffer(buf, dtype=dtype, count=length, offset=start + offset)
+
+    names = NameTable(arrays.pop("name_ptr"), arrays.pop("name_data"))
+    return Circuit(names, **arrays)
+
+
+def cache_path(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    directory, base = os.path.split(path)
+    return os.path.join(directory, "." + base + "." + h.hexdigest()[:16] + BINARY_EXT)
+
+
+def load(path, cache=True):
+    """Load a circuit from a binary file or a {nodes, links} JSON file.
+
+    JSON files are converted once and cached as a hidden binary file next
+    to the source, keyed by the source's content hash, so later loads of the
+    same circuit are a memory map.
+    """
+    if path.endswith(BINARY_EXT):
+        return load_binary(path)
+
+    if not cache:
+        with open(path, 'r') as f:
+            return from_json(json.load(f))
+
+    cached = cache_path(path)
+    if os.path.exists(cached):
+        return load_binary(cached)
+
+    with open(path, 'r') as f:
+        circuit = from_json(json.load(f))
+
+    try:
+        # Write under a private name and rename so that concurrent loaders
+        # never map a half-written file; drop caches of older contents
+        tmp = cached + "." + str(os.getpid()) + ".tmp"
+        save_binary(circuit, tmp)
+        os.replace(tmp, cached)
+
+        directory, base = os.path.split(cached)
+        for stale in glob.glob(os.path.join(glob.escape(directory), "." + glob.escape(os.path.basename(path)) + ".*" + BINARY_EXT)):
+            if os.path.basename(stale) != base:
+                os.remove(stale)
+    except OSError:
+        pass
+
+    return circuit
+
+
+def to_json(circuit, groups=None, copies=None):
+    # copies: node -> extra partitions holding a copy of it (see replicate.py)
+    if groups is None:
+        groups = circuit.groups
+
+    names = list(circuit.names)
+
+    nodes = []
+    for i, n in enumerate(names):
+        nodes.append({
+            "id": n,
+            "group": int(groups[i])
+        })
+        if copies and copies.get(i):
+            nodes[-1]["copies"] = sorted(int(p) for p in copies[i])
+
+    links = []
+    sources, targets = circuit.edges()
+    for s, t, w in zip(sources.tolist(), targets.tolist(), circuit.succ_weight.tolist()):
+        links.append({
+            "source": names[s],
+            "target": names[t],
+            "value": w
+        })
+
+    if circuit.succ_wire is not None:
+        for l, wire in zip(links, circuit.succ_wire.tolist()):
+            l["wire"] = wire
+
+    return {
+        "nodes": nodes,
+        "links": links
+    }
+
+
+def dump(circuit, path, groups=None, copies=None):
+    with open(path, 'w') as f:
+        json.dump(to_json(circuit, groups, copies), f)
+
+
+def to_networkx(circuit, directed=True):
+    # For the few algorithms that still need networkx (flows, cuts); nodes
+    # are the integer indices
+    import networkx as nx
+
+    G = nx.DiGraph() if directed else nx.Graph()
+    G.add_nodes_from(range(circuit.n_nodes))
+
+    sources, targets = circuit.edges()
+    G.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), circuit.succ_weight.tolist()))
+
+    return G
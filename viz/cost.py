@@ -1,37 +1,23 @@
 import argparse
-import json
 import networkx as nx
-from itertools import permutations 
+import numpy as np
 from collections import Counter
 import sys
 
-def to_networkx(graph_json):
-    G = nx.DiGraph()
+import circuit
+from stats import cluster_count, cluster_memory
 
-    node_group_map = {}
-    for n in graph["nodes"]:
-        G.add_node((n["id"], n["group"]))
-        node_group_map[n["id"]] = n["group"]
 
-    for l in graph["links"]:
-        G.add_edge(
-            (l["source"], node_group_map[l["source"]]),
-            (l["target"], node_group_map[l["target"]]), 
-            weight=l["value"]
-        )
-
-    return G
-
-
-def get_subclusters(G):
-    nodes_seen = set()
+def get_subclusters(c):
+    groups = c.groups
+    nodes_seen = np.zeros(c.n_nodes, dtype=bool)
     sub_clusters = []
 
-    for n in G:
-        if n in nodes_seen:
+    for n in range(c.n_nodes):
+        if nodes_seen[n]:
             continue
 
-        cluster_num = n[1]
+        cluster_num = groups[n]
 
         unexplored_nodes = set()
         unexplored_nodes.add(n)
@@ -40,19 +26,15 @@ def get_subclusters(G):
 
         while unexplored_nodes:
             curr_node = unexplored_nodes.pop()
-            if curr_node[1] != cluster_num:
+            if groups[curr_node] != cluster_num:
                 continue
 
-            nodes_seen.add(curr_node)
+            nodes_seen[curr_node] = True
             sub_cluster.append(curr_node)
 
-            for pre in G.predecessors(curr_node):
-                if pre not in nodes_seen:
-                    unexplored_nodes.add(pre)
-
-            for post in G.successors(curr_node):
-                if post not in nodes_seen:
-                    unexplored_nodes.add(post)
+            for m in c.neighbors(curr_node).tolist():
+                if not nodes_seen[m]:
+                    unexplored_nodes.add(m)
 
         sub_clusters.append(sub_cluster)
 
@@ -61,69 +43,87 @@ def get_subclusters(G):
 
 def get_subcluster_idx(subclusters, n):
     for i, s in enumerate(subclusters):
-        for pair in s:
-            if n == pair[0]:
+        for m in s:
+            if n == m:
                 return i
 
 
+def subcluster_depth(c, sc):
+    members = set(sc)
+    sc_G = nx.DiGraph()
+    sc_G.add_nodes_from(sc)
+    for n in sc:
+        start, end = c.succ_ptr[n], c.succ_ptr[n+1]
+        for post, w in zip(c.succ_idx[start:end].tolist(), c.succ_weight[start:end].tolist()):
+            if post in members:
+                sc_G.add_edge(n, post, weight=w)
+
+    return len(nx.dag_longest_path(sc_G))
+
+
 AND_COST = 8
 XOR_COST = 2
 INV_COST = 1
 
-def _schedule_gates(cluster_states, completed_gates):
+GATE_COSTS = {
+    circuit.AND: AND_COST,
+    circuit.XOR: XOR_COST,
+    circuit.INV: INV_COST,
+}
+
+
+def _schedule_gates(c, cluster_states, completed_gates, completed):
     for state in cluster_states:
         if state['exec_remaining'] != 0:
             continue
 
-        if state['current_gate']:
+        if state['current_gate'] is not None:
             completed_gates.append(state['current_gate'])
+            completed[state['current_gate']] = True
 
         state['current_gate'] = None
         for g in state['gates']:
             flag = True
-            for pre in G.predecessors(g):
-                if not (pre in completed_gates or "INPUT" in pre[0]):
+            for pre in c.predecessors(g).tolist():
+                if not (completed[pre] or c.types[pre] == circuit.INPUT):
                     flag = False
 
             if flag:
                 state['gates'].remove(g)
                 state['current_gate'] = g
-                if 'AND' in g[0]:
-                    state['exec_remaining'] = AND_COST
-                elif 'XOR' in g[0]:
-                    state['exec_remaining'] = XOR_COST
-                elif 'INV' in g[0]:
-                    state['exec_remaining'] = INV_COST
+                if c.types[g] in GATE_COSTS:
+                    state['exec_remaining'] = GATE_COSTS[c.types[g]]
                 else:
-                    print("Bad gate label", g[0])
+                    print("Bad gate label", c.names[g])
                     exit(1)
 
                 break
 
 
-def rough_sim(args, G, out, distributed=True):
+def rough_sim(args, c, out, distributed=True):
 
-    n_clusters = max([n[1] for n in G]) + 1
+    n_clusters = cluster_count(c)
     cluster_states = [{'current_gate': None, 'exec_remaining': 0, 'gates': []} for i in range(n_clusters)]
 
     n_gates_to_execute = 0
-    for n in G:
-        if "INPUT" in n[0] or "OUTPUT" in n[0]:
+    for n in range(c.n_nodes):
+        if c.types[n] == circuit.INPUT or c.types[n] == circuit.OUTPUT:
             continue
-        cluster = n[1] if distributed else 0
+        cluster = c.groups[n] if distributed else 0
         cluster_states[cluster]['gates'].append(n)
         n_gates_to_execute += 1
 
-    completed_gates = [] 
-    _schedule_gates(cluster_states, completed_gates)
+    completed_gates = []
+    completed = np.zeros(c.n_nodes, dtype=bool)
+    _schedule_gates(c, cluster_states, completed_gates, completed)
 
     tick = 0
     while len(completed_gates) != n_gates_to_execute:
         for s in cluster_states:
-            if s['current_gate']:
+            if s['current_gate'] is not None:
                 s['exec_remaining'] -= 1
 
-        _schedule_gates(cluster_states, completed_gates)
+        _schedule_gates(c, cluster_states, completed_gates, completed)
         tick += 1
 
     if args.verbose:
@@ -132,38 +132,32 @@ def rough_sim(args, G, out, distributed=True):
         print(tick, file = out)
 
 
-def stats(args, G, out):
-
-    memory_costs = []
-    for i in range(32):
-        memory_costs.append(0)
+def stats(args, c, out):
 
-    for n in G:
-        cluster = n[1]
-        gate = n[0]
+    names, groups, types = c.names, c.groups, c.types
 
-        if "INV" in gate or "XOR" in gate:
-            memory_costs[cluster] += 32
-        elif "AND" in gate:
-            memory_costs[cluster] += 237
-
-    for i in range(32):
+    memory_costs = cluster_memory(c, cluster_count(c)).tolist()
+    for i in range(len(memory_costs)):
         print("cluster", i, "memory cost:", memory_costs[i])
 
-    subclusters = get_subclusters(G)
-    counter = Counter([sc[0][1] for sc in subclusters])
+    subclusters = get_subclusters(c)
+    counter = Counter([groups[sc[0]] for sc in subclusters])
     if args.verbose:
         #print("--- Cluster Summary ---", file = out)
         for cluster_n in counter:
-            nodes = sum([len(sc) for sc in subclusters if sc[0][1] == cluster_n])
+            nodes = sum([len(sc) for sc in subclusters if groups[sc[0]] == cluster_n])
             #print(str(cluster_n)+")", nodes, "nodes ["+str(counter[cluster_n])+" subcluster(s)]", file = out)
             for i, sc in enumerate(subclusters):
-                if sc[0][1] != cluster_n:
+                if groups[sc[0]] != cluster_n:
                     continue
                 #print("\tSub-cluster", str(i)+":", len(sc), "node(s)", file = out)
         #print('\n', file = out)
 
-    counter = Counter([(e[0][1], e[1][1]) for e in G.edges() if e[0][1] != e[1][1]])
+    sources, targets = c.edges()
+    cross = groups[sources] != groups[targets]
+    cross_sources, cross_targets = sources[cross].tolist(), targets[cross].tolist()
+
+    counter = Counter([(groups[s], groups[t]) for s, t in zip(cross_sources, cross_targets)])
     if not args.verbose:
         #print(sum(counter.values()), file = out)
         pass
@@ -175,7 +169,7 @@ def stats(args, G, out):
             pass
         #$print('\n', file = out)
 
-        counter = Counter([(get_subcluster_idx(subclusters, e[0][0]), get_subcluster_idx(subclusters, e[1][0])) for e in G.edges() if e[0][1] != e[1][1]])
+        counter = Counter([(get_subcluster_idx(subclusters, s), get_subcluster_idx(subclusters, t)) for s, t in zip(cross_sources, cross_targets)])
         #print("Total cross-sub-cluster edge(s):", sum(counter.values()), file = out)
 
         subcluster_G = nx.DiGraph()
@@ -183,7 +177,7 @@ def stats(args, G, out):
             subcluster_G.add_node(i)
 
         for e_count in counter:
-            #print("\t"+str(e_count[0])+" (cluster " + str(subclusters[e_count[0]][0][1]) + ") -> "+str(e_count[1])+" (cluster " + str(subclusters[e_count[1]][0][1]) + "):", counter[e_count], "edge(s)", file = out)
+            #print("\t"+str(e_count[0])+" (cluster " + str(groups[subclusters[e_count[0]][0]]) + ") -> "+str(e_count[1])+" (cluster " + str(groups[subclusters[e_count[1]][0]]) + "):", counter[e_count], "edge(s)", file = out)
             subcluster_G.add_edge(e_count[0], e_count[1])
 
         #print('\n', file = out)
@@ -198,7 +192,7 @@ def stats(args, G, out):
         for i, sc in enumerate(subclusters):
             #print("--- Sub-cluster", i, "Summary ---", file = out)
 
-            cluster_num = sc[0][1]
+            cluster_num = groups[sc[0]]
 
             n_inputs = 0
             n_outputs = 0
@@ -208,33 +202,32 @@ def stats(args, G, out):
             outgoing_edges = []
 
             for gate in sc:
-                if "INPUT" in gate[0]:
+                if types[gate] == circuit.INPUT:
                     n_inputs += 1
-                elif "OUTPUT" in gate[0]:
+                elif types[gate] == circuit.OUTPUT:
                     n_outputs += 1
-                elif "AND" in gate[0]:
+                elif types[gate] == circuit.AND:
                     n_and += 1
-                elif "XOR" in gate[0]:
+                elif types[gate] == circuit.XOR:
                     n_xor += 1
-                elif "INV" in gate[0]:
+                elif types[gate] == circuit.INV:
                     n_inv += 1
 
-                for pre in G.predecessors(gate):
-                    if pre[1] != cluster_num:
-                        incoming_edges.append((pre, get_subcluster_idx(subclusters, pre[0])))
+                for pre in c.predecessors(gate).tolist():
+                    if groups[pre] != cluster_num:
+                        incoming_edges.append((pre, get_subcluster_idx(subclusters, pre)))
 
-                for post in G.successors(gate):
-                    if post[1] != cluster_num:
-                        outgoing_edges.append((post, get_subcluster_idx(subclusters, post[0])))
+                for post in c.successors(gate).tolist():
+                    if groups[post] != cluster_num:
+                        outgoing_edges.append((post, get_subcluster_idx(subclusters, post)))
 
-            sc_view = nx.subgraph_view(G, filter_node = lambda n: n in sc)
-            sc_depth = len(nx.dag_longest_path(sc_view))
+            sc_depth = subcluster_depth(c, sc)
 
             #print("Input bits:", n_inputs, file = out)
             #print("Incoming edges:", len(incoming_edges), file = out)
             for e in incoming_edges:
                 pass
-                #print("    From", e[0][0], "| Sub-cluster", e[1], "(Cluster", str(e[0][1])+")", file = out)
+                #print("    From", names[e[0]], "| Sub-cluster", e[1], "(Cluster", str(groups[e[0]])+")", file = out)
             #print("Gates:", file = out)
             #print("    AND:", n_and, file = out)
             #print("    XOR:", n_xor, file = out)
@@ -243,20 +236,18 @@ def stats(args, G, out):
             #print("Output bits:", n_outputs, file = out)
             #print("Outgoing edges:", len(outgoing_edges), file = out)
             for e in outgoing_edges:
-                #print("    To", e[0][0], "| Sub-cluster", e[1], "(Cluster", str(e[0][1])+")", file = out)
+                #print("    To", names[e[0]], "| Sub-cluster", e[1], "(Cluster", str(groups[e[0]])+")", file = out)
                 pass
 
 
 parser = argparse.ArgumentParser(description="Generate stats on partitioned graphs")
 parser.add_argument("in_json_file", help="Path to input partitioned graph")
+parser.add_argument("--verbose", help="Print verbose information", action='store_true')
 
 args = parser.parse_args()
-with open(args.in_json_file, 'r') as f:
-    graph = json.load(f)
-
-G = to_networkx(graph)
 
-stats(args, G, sys.stdout)
-rough_sim(args, G, sys.stdout)
-rough_sim(args, G, sys.stdout, distributed=False)
+c = circuit.load(args.in_json_file)
 
+stats(args, c, sys.stdout)
+rough_sim(args, c, sys.stdout)
+rough_sim(args, c, sys.stdout, distributed=False)
@@ -0,0 +1,163 @@
+import argparse
+import math
+import numpy as np
+
+import circuit
+import stats
+
+
+def gate_costs(c):
+    # Same per-gate tick costs as the simulator, 0 for input/output bits
+    costs = np.zeros(len(circuit.GATE_TYPE_NAMES), dtype=np.int64)
+    for t, cost in stats.GATE_COSTS.items():
+        costs[t] = cost
+    return costs[c.types]
+
+
+def gate_levels(c):
+    """Logic level of every node: inputs are level 0, a gate is one more than
+    its deepest predecessor. Relies on nodes being in topological order.
+    """
+    levels = [0 for i in range(c.n_nodes)]
+    pred_ptr = c.pred_ptr.tolist()
+    pred_idx = c.pred_idx.tolist()
+    for v in range(c.n_nodes):
+        preds = pred_idx[pred_ptr[v]:pred_ptr[v+1]]
+        if preds:
+            levels[v] = max(levels[p] for p in preds) + 1
+    return np.array(levels, dtype=np.int64)
+
+
+def asap_alap(c, costs):
+    """Earliest and latest start tick of every gate with unlimited nodes.
+
+    Returns (asap, alap, critical path length); alap - asap is the slack a
+    gate has before it delays the whole circuit.
+    """
+    costs = costs.tolist()
+    pred_ptr = c.pred_ptr.tolist()
+    pred_idx = c.pred_idx.tolist()
+    succ_ptr = c.succ_ptr.tolist()
+    succ_idx = c.succ_idx.tolist()
+
+    asap = [0 for i in range(c.n_nodes)]
+    for v in range(c.n_nodes):
+        for p in pred_idx[pred_ptr[v]:pred_ptr[v+1]]:
+            asap[v] = max(asap[v], asap[p] + costs[p])
+
+    length = max([a + w for a, w in zip(asap, costs)] + [0])
+
+    alap = [length - w for w in costs]
+    for v in reversed(range(c.n_nodes)):
+        for s in succ_idx[succ_ptr[v]:succ_ptr[v+1]]:
+            alap[v] = min(alap[v], alap[s] - costs[v])
+
+    return np.array(asap, dtype=np.int64), np.array(alap, dtype=np.int64), length
+
+
+def message_delay(network):
+    if not network:
+        return 0
+    delay = network['latency'] + network['overhead']
+    if network['bandwidth']:
+        delay += math.ceil(1 / network['bandwidth'])
+    return delay
+
+
+def critical_path(c, n_partitions, network=None, speeds=None):
+    """List-schedule the gates onto n_partitions nodes, assigning each to a
+    node as it goes.
+
+    Gates are taken in circuit order, the order the simulator prefers them
+    in. A gate may go to any node where it still finishes by its ALAP
+    deadline (or as early as anywhere else, once the schedule is behind);
+    among those it picks the node holding most of its neighbours, so chains
+    stay local while each level's work spreads over idle nodes. A remote
+    input costs the network model's per-message delay, and a gate's cost is
+    scaled by the node's speed like in the simulator.
+
+    Returns the groups and the predicted makespan in ticks.
+    """
+    costs = gate_costs(c)
+    asap, alap, length = asap_alap(c, costs)
+    deadline = (alap + costs).tolist()
+    costs = costs.tolist()
+    delay = message_delay(network)
+
+    types = c.types.tolist()
+    pred_ptr = c.pred_ptr.tolist()
+    pred_idx = c.pred_idx.tolist()
+    succ_ptr = c.succ_ptr.tolist()
+    succ_idx = c.succ_idx.tolist()
+
+    parts = [-1 for i in range(c.n_nodes)]
+    finish = [0 for i in range(c.n_nodes)]
+    free = [0 for i in range(n_partitions)]
+
+    for g in range(c.n_nodes):
+        if costs[g] == 0:
+            continue
+
+        # Latest input per node the inputs come from
+        local = {}
+        for p in pred_idx[pred_ptr[g]:pred_ptr[g+1]]:
+            if types[p] != circuit.INPUT:
+                local[parts[p]] = max(local.get(parts[p], 0), finish[p])
+
+        ends = []
+        for i in range(n_partitions):
+            ready = max([t if j == i else t + delay for j, t in local.items()] + [0])
+            cost = stats.scaled_cost(costs[g], speeds[i]) if speeds else costs[g]
+            ends.append(max(ready, free[i]) + cost)
+
+        allowed = max(min(ends), deadline[g])
+
+        neighbours = [0 for i in range(n_partitions)]
+        for p in pred_idx[pred_ptr[g]:pred_ptr[g+1]] + succ_idx[succ_ptr[g]:succ_ptr[g+1]]:
+            if parts[p] >= 0:
+                neighbours[parts[p]] += 1
+
+        best = min((i for i in range(n_partitions) if ends[i] <= allowed),
+                   key=lambda i: (-neighbours[i], ends[i], i))
+
+        parts[g] = best
+        finish[g] = ends[best]
+        free[best] = ends[best]
+
+    # Input bits go with their first reader, output bits with their writer
+    for v in range(c.n_nodes):
+        if types[v] == circuit.INPUT:
+            readers = [s for s in succ_idx[succ_ptr[v]:succ_ptr[v+1]] if parts[s] >= 0]
+            parts[v] = parts[readers[0]] if readers else 0
+        elif types[v] == circuit.OUTPUT:
+            writers = [p for p in pred_idx[pred_ptr[v]:pred_ptr[v+1]] if parts[p] >= 0]
+            parts[v] = parts[writers[0]] if writers else 0
+
+    return np.array(parts, dtype=np.int32), max(finish + [0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Critical-path-aware graph partition algorithm")
+    parser.add_argument("in_json_file", help="Input file location")
+    parser.add_argument("out_json_file", help="Output file location")
+    parser.add_argument("--partitions", default=3, type=int, help="number of graph partitions")
+    parser.add_argument("--latency", type=int, default=0, help="Network latency in ticks")
+    parser.add_argument("--msg_overhead", type=int, default=0, help="Per-message network overhead in ticks")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Wires per tick per link (0 = unlimited)")
+    parser.add_argument("--batch_window", type=int, default=0, help="Wire batching window in ticks (0 = no batching)")
+    parser.add_argument("--node_speed", type=float, nargs="+", default=None, help="Relative speed of each node, one value for all or one per node")
+
+    args = parser.parse_args()
+
+    c = circuit.load(args.in_json_file)
+
+    groups, makespan = critical_path(c, args.partitions, stats.network_model(args), stats.node_speeds(args, args.partitions))
+
+    costs = gate_costs(c)
+    _, _, length = asap_alap(c, costs)
+    print("Levels:", int(gate_levels(c).max()))
+    print("Critical path:", length, "ticks")
+    print("Work per node:", int(math.ceil(costs.sum() / args.partitions)), "ticks")
+    print("Predicted makespan:", makespan, "ticks")
+
+    circuit.dump(c, args.out_json_file, groups)
@@ -1,49 +1,43 @@
 import argparse
-import os
-
-TEMP_PATH = "/tmp/temp_circuit"
-
-parser = argparse.ArgumentParser(description="Run test")
-parser.add_argument("in_circuit_file", help="Path to input circuit json file")
-parser.add_argument("--out_file", help="Path to output data file (append)")
-parser.add_argument("--and_cost", type=int, help="AND cost", required=True)
-parser.add_argument("--xor_cost", type=int, help="XOR cost", required=True)
-parser.add_argument("--inv_cost", type=int, help="INV cost", required=True)
-parser.add_argument("--gamma", type=float, help="Fennel gamma value", required=True)
-parser.add_argument("--clusters", type=int, help="Number of clusters", required=True)
-parser.add_argument("--algorithm", choices=["fennel", "fennel-weighted", "fennel-output"], help="Clustering algorithm", required=True)
-
-args = parser.parse_args()
-
-command_str = "python3 fennel.py --partitions " + str(args.clusters) + " --gamma " + str(args.gamma) + " --and_cost " + str(args.and_cost) + " --xor_cost " + str(args.xor_cost) + " --inv_cost " + str(args.inv_cost)
-
-if args.algorithm == "fennel-weighted":
-    command_str += " --weighted_size"
-elif args.algorithm == "fennel-output":
-    command_str += " --output_influence"
-elif args.algorithm == "fennel":
-    pass
-
-command_str += " " + args.in_circuit_file + " " + TEMP_PATH + ".json"
-
-# Cluster graph
-print("\t", command_str)
-ret = os.system(command_str)
-if ret != 0:
-    print("return:", ret)
-
-sim_command_str = "python3 stats.py " + TEMP_PATH + ".json --out " + TEMP_PATH + ".txt"
-print("\t", sim_command_str)
-ret = os.system(sim_command_str)
-if ret != 0:
-    print("return:", ret)
-
-with open(TEMP_PATH+".txt", "r") as f:
-    lines = [l.strip() for l in f.readlines()]
+import sys
+
+import circuit
+import fennel
+import sweep
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run test")
+    parser.add_argument("in_circuit_file", help="Path to input circuit json file")
+    parser.add_argument("--out_file", help="Path to output data file (append)")
+    parser.add_argument("--and_cost", type=int, help="AND cost", required=True)
+    parser.add_argument("--xor_cost", type=int, help="XOR cost", required=True)
+    parser.add_argument("--inv_cost", type=int, help="INV cost", required=True)
+    parser.add_argument("--gamma", type=float, help="Fennel gamma value", required=True)
+    parser.add_argument("--clusters", type=int, help="Number of clusters", required=True)
+    parser.add_argument("--algorithm", choices=sweep.ALGORITHMS, help="Clustering algorithm", required=True)
+    parser.add_argument("--passes", type=int, default=1, help="Maximum Fennel restreaming passes")
+    parser.add_argument("--converge", choices=["cut", "makespan", "volume"], default="cut", help="Stop restreaming once this stops improving")
+    parser.add_argument("--order", choices=fennel.ORDERS, default="natural", help="Order Fennel streams the gates in")
+    parser.add_argument("--lookahead", type=int, default=0, help="Fennel lookahead buffer size (0 = no buffer)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --order random")
+    parser.add_argument("--memory_budget", type=int, nargs="+", default=None, help="Fennel memory budget per partition, one value for all or one per partition")
+    parser.add_argument("--latency", type=int, default=0, help="Network latency in ticks for the simulation")
+    parser.add_argument("--msg_overhead", type=int, default=0, help="Per-message network overhead in ticks")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Wires per tick per link (0 = unlimited)")
+    parser.add_argument("--batch_window", type=int, default=0, help="Wire batching window in ticks (0 = no batching)")
+    parser.add_argument("--node_speed", type=float, nargs="+", default=None, help="Relative speed of each node, one value for all or one per node")
+    parser.add_argument("--node_capacity", type=float, nargs="+", default=None, help="Relative capacity of each node for Fennel (default: its speed)")
+
+    args = parser.parse_args()
+
+    config = {"gamma": args.gamma, "clusters": args.clusters, "algorithm": args.algorithm}
+
+    c = circuit.load(args.in_circuit_file)
+    row = sweep.evaluate(c, sweep.circuit_name(args.in_circuit_file), args, config)
+    if row is None:
+        sys.exit("The " + args.algorithm + " partition does not fit in the memory budgets")
 
     if args.out_file:
-        with open(args.out_file, 'a') as f:
-            print(os.path.splitext(os.path.basename(args.in_circuit_file))[0], lines[2], args.algorithm, args.clusters, lines[0], lines[1], args.gamma, args.and_cost, args.xor_cost, args.inv_cost, sep=",", file = f)
+        sweep.append_row(args.out_file, row)
     else:
-        print(os.path.splitext(os.path.basename(args.in_circuit_file))[0], lines[2], args.algorithm, args.clusters, lines[0], lines[1], args.gamma, args.and_cost, args.xor_cost, args.inv_cost, sep=",")
-
+        print(sweep.format_row(row), end="")
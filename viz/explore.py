@@ -1,29 +1,39 @@
 import argparse
-import os
-import random
 
-parser = argparse.ArgumentParser(description="Turn all the knobs as much as possible")
-parser.add_argument("in_circuit_file", help="Path to input circuit json file")
-parser.add_argument("out_data_file", help="Path to output file for circuit sim results")
-parser.add_argument("--and_cost", type=int, help="AND cost", required=True)
-parser.add_argument("--xor_cost", type=int, help="XOR cost", required=True)
-parser.add_argument("--inv_cost", type=int, help="INV cost", required=True)
-parser.add_argument("--n_iter", type=int, help="Number of interations", required=True)
+import fennel
+import search
+import sweep
 
-args = parser.parse_args()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turn all the knobs as much as possible")
+    parser.add_argument("in_circuit_file", help="Path to input circuit json file")
+    parser.add_argument("out_data_file", help="Path to output file for circuit sim results")
+    parser.add_argument("--and_cost", type=int, help="AND cost", required=True)
+    parser.add_argument("--xor_cost", type=int, help="XOR cost", required=True)
+    parser.add_argument("--inv_cost", type=int, help="INV cost", required=True)
+    parser.add_argument("--n_iter", type=int, help="Number of interations", required=True)
+    parser.add_argument("--strategy", choices=search.STRATEGIES.keys(), default="random", help="How to pick the next configurations")
+    parser.add_argument("--prune_slack", type=float, default=None, help="Stop a configuration once it is this fraction worse than the best distributed ticks so far")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the search strategy")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--passes", type=int, default=1, help="Maximum Fennel restreaming passes")
+    parser.add_argument("--converge", choices=["cut", "makespan", "volume"], default="cut", help="Stop restreaming once this stops improving")
+    parser.add_argument("--order", choices=fennel.ORDERS, default="natural", help="Order Fennel streams the gates in")
+    parser.add_argument("--lookahead", type=int, default=0, help="Fennel lookahead buffer size (0 = no buffer)")
+    parser.add_argument("--memory_budget", type=int, nargs="+", default=None, help="Fennel memory budget of every partition")
+    parser.add_argument("--latency", type=int, default=0, help="Network latency in ticks for the simulation")
+    parser.add_argument("--msg_overhead", type=int, default=0, help="Per-message network overhead in ticks")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Wires per tick per link (0 = unlimited)")
+    parser.add_argument("--batch_window", type=int, default=0, help="Wire batching window in ticks (0 = no batching)")
+    parser.add_argument("--node_speed", type=float, nargs="+", default=None, help="Relative speed of every node")
+    parser.add_argument("--node_capacity", type=float, nargs="+", default=None, help="Relative capacity of every node for Fennel (default: its speed)")
 
-def get_knobs():
-    return (random.uniform(1.0, 8.0), random.randint(3, 32), random.choice(['fennel', 'fennel-weighted', 'fennel-output']))
+    args = parser.parse_args()
 
-tried = []
-for i in range(args.n_iter):
-    k = get_knobs()
-    while k in tried:
-        k = get_knobs()
-
-    command_str = "python3 eval.py " + args.in_circuit_file + " --out_file " + args.out_data_file + " --clusters " + str(k[1]) + " --gamma " + str(k[0]) + " --and_cost " + str(args.and_cost) + " --xor_cost " + str(args.xor_cost) + " --inv_cost " + str(args.inv_cost) + " --algorithm " + k[2]
-
-    ret = os.system(command_str)
-    if ret != 0:
-        print("ERROR - return val:", ret)
+    # The search picks the number of clusters, so per-node lists cannot be matched to it
+    for name in ("memory_budget", "node_speed", "node_capacity"):
+        if getattr(args, name) and len(getattr(args, name)) > 1:
+            parser.error("--" + name + " takes a single value here, the number of clusters varies")
 
+    strategy = search.STRATEGIES[args.strategy](sweep.ALGORITHMS, args.n_iter, args.seed)
+    sweep.run_search(args.in_circuit_file, args, strategy, args.n_iter, args.out_data_file, args.jobs, args.prune_slack)
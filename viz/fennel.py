@@ -1,167 +1,393 @@
 import argparse
-import json
-import networkx as nx
-from itertools import permutations 
-
-def to_networkx(graph_json):
-    G = nx.DiGraph()
-
-    for n in graph["nodes"]:
-        G.add_node(n["id"])
-
-    for l in graph["links"]:
-        G.add_edge(l["source"], l["target"], weight=l["value"])
-
-    return G
-
-def from_networkx(G, partitions):
-    nodes = []
-    for n in G:
-        group = 0
-        for i, p in enumerate(partitions):
-            if n in p:
-                group = i
-
-        nodes.append({
-            "id": n,
-            "group": group
-        })
-
-    links = []
-    for e in G.edges():
-        links.append({
-            "source": e[0],
-            "target": e[1],
-            "value": G[e[0]][e[1]]["weight"]
-        })
+import collections
+import numpy as np
 
-    return {
-        "nodes": nodes,
-        "links": links
-    }
+import circuit
+import critpath
+import stats
 
 
-def num_edges_in_partition(G, partition):
-    edges = [e for e in G.edges(partition) if e[0] in partition and e[1] in partition]
-    return len(edges)
+class MemoryBudgetError(ValueError):
+    """The gates do not fit in the partitions' memory budgets."""
 
 
-def weighted_size(args, G, p):
-    size = 0
-    for n in p:
-        if 'AND' in n:
-            size += args.and_cost
-        elif 'XOR' in n:
-            size += args.xor_cost
-        elif 'INV' in n:
-            size += args.inv_cost
+def node_sizes(args, c):
+    if not args.weighted_size:
+        return np.ones(c.n_nodes, dtype=np.float64)
 
-    return size
+    gate_costs = np.zeros(len(circuit.GATE_TYPE_NAMES), dtype=np.float64)
+    gate_costs[circuit.AND] = args.and_cost
+    gate_costs[circuit.XOR] = args.xor_cost
+    gate_costs[circuit.INV] = args.inv_cost
 
+    return gate_costs[c.types]
 
-def default_size(args, G, p):
-    return len(p)
 
-
-def partition_cost(args, G, n_partitions, p_size, G_size, gamma=None):
+def partition_alpha(args, c, n_partitions, G_size, gamma=None):
     if not gamma:
         gamma = args.gamma
-    alpha = nx.number_of_edges(G) * ((n_partitions**(gamma-1)) / (G_size**gamma))
-
-    return alpha * (p_size**gamma)
+    return c.n_edges * ((n_partitions**(gamma-1)) / (G_size**gamma))
 
 
-def g(G, partition_list, args):
-    result = 0
+def partition_cost(args, alpha, p_size, gamma=None):
+    if not gamma:
+        gamma = args.gamma
+    return alpha * (p_size**gamma)
 
-    partition_size = default_size
-    if args.weighted_size:
-        partition_size = weighted_size
 
-    for p in partition_list:
-        n_partitions = len(partition_list)
-        p_view = nx.subgraph_view(G, filter_node = lambda n: n in p)
-        p_view = p_view.to_undirected()
+def node_capacities(args, n_partitions):
+    """Relative capacity of each partition's node, scaled to an average of
+    1. Without args.node_capacity the nodes' speeds are used, so faster
+    nodes get more gates."""
+    capacity = stats.per_cluster(args.node_capacity or args.node_speed, n_partitions, "node capacities")
+    if capacity is None:
+        return [1.0 for i in range(n_partitions)]
 
-        cost = num_edges_in_partition(G, p) - \
-            partition_cost(args, G, n_partitions, partition_size(args, G, p), partition_size(args, G, G))
-        result += cost
+    total = float(sum(capacity))
+    return [x * n_partitions / total for x in capacity]
 
-    return result
 
+def init_state(c, args):
+    # Running per-partition state so that the objective change for a vertex
+    # only depends on its neighbours and the size of each partition
+    n_partitions = args.partitions
+    sizes = node_sizes(args, c)
 
-def delta_g(G, vertex, partition_idx, partition_list, args):
+    return {
+        'sizes': [0 for i in range(n_partitions)],
+        # gate -> partition index (-1 if not placed yet)
+        'parts': np.full(c.n_nodes, -1, dtype=np.int32),
+        # input/output bit -> {partition index: number of gates there using it},
+        # they can be in several partitions
+        'io_parts': {},
+        'node_size': sizes,
+        'alpha': partition_alpha(args, c, n_partitions, float(sizes.sum())),
+        # Garbled table memory in each partition, kept under the budgets
+        'memory': [0 for i in range(n_partitions)],
+        'node_memory': stats.gate_memory(c).tolist(),
+        'budgets': stats.memory_budgets(args.memory_budget, n_partitions),
+        'capacity': node_capacities(args, n_partitions),
+    }
 
-    g_without_v = g(G, partition_list, args)
-    
-    partition_list[partition_idx].append(vertex)
-    g_with_v = g(G, partition_list, args)
-    partition_list[partition_idx].remove(vertex)
 
-    return g_with_v - g_without_v
+def add_to_partition(c, state, v, partition_idx):
+    state['sizes'][partition_idx] += state['node_size'][v]
+    state['memory'][partition_idx] += state['node_memory'][v]
+    if c.types[v] == circuit.INPUT or c.types[v] == circuit.OUTPUT:
+        io_parts = state['io_parts'].setdefault(v, {})
+        io_parts[partition_idx] = io_parts.get(partition_idx, 0) + 1
+    else:
+        state['parts'][v] = partition_idx
+
+
+def remove_from_partition(c, state, v, partition_idx):
+    state['sizes'][partition_idx] -= state['node_size'][v]
+    state['memory'][partition_idx] -= state['node_memory'][v]
+    if c.types[v] == circuit.INPUT or c.types[v] == circuit.OUTPUT:
+        io_parts = state['io_parts'][v]
+        io_parts[partition_idx] -= 1
+        if not io_parts[partition_idx]:
+            del io_parts[partition_idx]
+    else:
+        state['parts'][v] = -1
+
+
+def neighbours_per_partition(c, vertex, state):
+    counts = [0 for i in range(len(state['sizes']))]
+    parts = state['parts']
+    io_parts = state['io_parts']
+
+    for n in c.neighbors(vertex).tolist():
+        p = parts[n]
+        if p >= 0:
+            counts[p] += 1
+        else:
+            for p in io_parts.get(n, ()):
+                counts[p] += 1
+
+    return counts
+
+
+def wire_savings(c, vertex, state):
+    """Wires that placing vertex in each partition would add to the network,
+    negated so that more is better like a neighbour count.
+
+    Each gate drives one wire: an input wire costs one send to a partition
+    that neither produces it nor already reads it, and the vertex's own wire
+    one send per other partition already reading it. Input bits go along
+    with their gates and are never sent.
+    """
+    n_partitions = len(state['sizes'])
+    added = [0 for i in range(n_partitions)]
+    parts = state['parts']
+    types = c.types
+
+    for pre in c.predecessors(vertex).tolist():
+        if types[pre] == circuit.INPUT:
+            continue
+        has = set(parts[s] for s in c.successors(pre).tolist() if s != vertex)
+        has.add(parts[pre])
+        for p in range(n_partitions):
+            if p not in has:
+                added[p] += 1
 
+    readers = set(parts[s] for s in c.successors(vertex).tolist() if parts[s] >= 0)
+    for p in range(n_partitions):
+        added[p] += len(readers) - (p in readers)
 
-def vertex_assignment(G, vertex, partition_list, args):
+    return [-a for a in added]
 
-    max_partition = 0
-    max_dg = -float("inf")
 
-    for i in range(len(partition_list)):
-        dg = delta_g(G, vertex, i, partition_list, args)
-        if dg > max_dg:
-            max_dg = dg
-            max_partition = i
+def delta_g(args, vertex, partition_idx, n_neighbours, state):
+    # A partition of capacity cap pays cap * cost(size / cap), so partitions
+    # fill in proportion to their capacity
+    p_size = state['sizes'][partition_idx]
+    v_size = state['node_size'][vertex]
+    cap = state['capacity'][partition_idx]
+    alpha = state['alpha']
 
-    return max_partition
+    return n_neighbours - \
+        cap * (partition_cost(args, alpha, (p_size + v_size) / cap) - partition_cost(args, alpha, p_size / cap))
 
 
-def fennel(G, args):
+def vertex_assignment(c, vertex, state, args):
 
-    n_partitions = args.partitions
-    partitions = [[] for i in range(n_partitions)]
+    max_partition = 0
+    max_dg = -float("inf")
 
-    for i,v in enumerate(G):
-        print(i)
-        if "INPUT" in v or "OUTPUT" in v:
+    neighbours = neighbours_per_partition(c, vertex, state)
+    if args.volume:
+        # Neighbours still count, they keep gates next to their input bits
+        neighbours = [n + s for n, s in zip(neighbours, wire_savings(c, vertex, state))]
+    budgets = state['budgets']
+    memory = state['memory']
+    v_memory = state['node_memory'][vertex]
+    for i in range(len(state['sizes'])):
+        # The budget is a hard limit, whatever the objective says
+        if budgets and memory[i] + v_memory > budgets[i]:
             continue
 
-        assignment = vertex_assignment(G, v, partitions, args)
-
-        partitions[assignment].append(v)
-        for pre in G.predecessors(v):
-            if "INPUT" in pre:
-                partitions[assignment].append(pre)
-
-        for post in G.successors(v):
-            if "OUTPUT" in post:
-                partitions[assignment].append(post)
-
-    return G, partitions
-    
-
-parser = argparse.ArgumentParser(description="Basic Fennel graph partition algorithm")
-parser.add_argument("in_json_file", help="Input file location")
-parser.add_argument("out_json_file", help="Output file location")
-parser.add_argument("--gamma", default=4, type=float, help="gamma for intra-cluster cost function")
-parser.add_argument("--and_cost", default=8, type=int, help="AND gate cost")
-parser.add_argument("--xor_cost", default=2, type=int, help="XOR gate cost")
-parser.add_argument("--inv_cost", default=1, type=int, help="INV gate cost")
-parser.add_argument("--partitions", default=3, type=int, help="number of graph partitions")
-parser.add_argument("--weighted_size", action="store_true")
-parser.add_argument("--output_influence", action="store_true")
-
-args = parser.parse_args()
-
-with open(args.in_json_file, 'r') as f:
-    graph = json.load(f)
-
-G = to_networkx(graph)
+        dg = delta_g(args, vertex, i, neighbours[i], state)
+        if dg > max_dg:
+            max_dg = dg
+            max_partition = i
 
-# Do the algorithm
-G_cut, partitions = fennel(G, args)
+    if max_dg == -float("inf"):
+        raise MemoryBudgetError(c.names[vertex] + " does not fit in any partition's memory budget")
 
-output_graph = from_networkx(G_cut, partitions)
+    return max_partition
 
-with open(args.out_json_file, 'w') as f:
-    json.dump(output_graph, f)
 
+def state_groups(state):
+    groups = np.maximum(state['parts'], 0)
+    # An input/output bit placed in several partitions is reported in the last
+    for v, ps in state['io_parts'].items():
+        groups[v] = max(ps)
+
+    return groups
+
+
+ORDERS = ["natural", "topo", "bfs", "dfs", "random"]
+
+
+def gate_order(c, order="natural", seed=None):
+    """Order to stream the gates in.
+
+    natural is circuit file order, topo sorts by logic level, bfs and dfs
+    walk backwards from the output bits (gates no output depends on come
+    last, in file order) and random is a seeded shuffle.
+    """
+    gates = np.flatnonzero((c.types != circuit.INPUT) & (c.types != circuit.OUTPUT))
+    if order == "natural":
+        return gates
+    if order == "topo":
+        return gates[np.argsort(critpath.gate_levels(c)[gates], kind="stable")]
+    if order == "random":
+        return np.random.default_rng(seed).permutation(gates)
+
+    is_gate = np.zeros(c.n_nodes, dtype=bool)
+    is_gate[gates] = True
+    seen = np.zeros(c.n_nodes, dtype=bool)
+    visited = []
+
+    outputs = np.flatnonzero(c.types == circuit.OUTPUT).tolist()
+    if order == "bfs":
+        frontier = collections.deque(outputs)
+        pop = frontier.popleft
+    else:
+        # Stack, so the first predecessor of a gate is walked first
+        frontier = outputs[::-1]
+        pop = frontier.pop
+    seen[outputs] = True
+
+    while frontier:
+        v = pop()
+        if is_gate[v]:
+            visited.append(v)
+        preds = c.predecessors(v).tolist()
+        for pre in (preds if order == "bfs" else preds[::-1]):
+            if not seen[pre]:
+                seen[pre] = True
+                frontier.append(pre)
+
+    rest = gates[~seen[gates]]
+    return np.concatenate((np.array(visited, dtype=gates.dtype), rest))
+
+
+def place_gate(c, state, v, partition_idx, place=add_to_partition):
+    # A gate takes its input and output bits along with it
+    types = c.types
+    place(c, state, v, partition_idx)
+    for pre in c.predecessors(v).tolist():
+        if types[pre] == circuit.INPUT:
+            place(c, state, pre, partition_idx)
+
+    for post in c.successors(v).tolist():
+        if types[post] == circuit.OUTPUT:
+            place(c, state, post, partition_idx)
+
+
+def buffered(c, state, gates, size):
+    """Yield the gates with a lookahead buffer of up to size gates, always
+    the buffered gate with the most already placed neighbours (the earliest
+    one on ties). Relies on the caller placing each gate before asking for
+    the next one.
+    """
+    placed = state['parts'] >= 0
+    placed[[v for v, ps in state['io_parts'].items() if ps]] = True
+    buffer = {}
+    gates = iter(gates)
+
+    while True:
+        for v in gates:
+            buffer[v] = int(placed[c.neighbors(v)].sum())
+            if len(buffer) >= size:
+                break
+        if not buffer:
+            return
+
+        v = max(buffer, key=buffer.get)
+        del buffer[v]
+        yield v
+
+        # The gate and any of its input/output bits that were not placed yet
+        for x in [v] + c.neighbors(v).tolist():
+            if placed[x] or not (state['parts'][x] >= 0 or state['io_parts'].get(x)):
+                continue
+            placed[x] = True
+            for n in c.neighbors(x).tolist():
+                if n in buffer:
+                    buffer[n] += 1
+
+
+def stream(c, state, args):
+    gates = gate_order(c, args.order, args.seed)
+    if args.lookahead > 1:
+        gates = buffered(c, state, gates.tolist(), args.lookahead)
+    else:
+        gates = gates.tolist()
+
+    # Gates already placed (by an earlier pass or a warm start) are taken out
+    # first, so they are reassigned with everything else in place
+    parts = state['parts']
+    for v in gates:
+        if parts[v] >= 0:
+            place_gate(c, state, v, parts[v], remove_from_partition)
+
+        place_gate(c, state, v, vertex_assignment(c, v, state, args))
+
+
+def partition_score(c, groups, args):
+    if args.converge == "makespan":
+        return stats.simulate(c.with_groups(groups), groups, args.partitions,
+                              speeds=stats.node_speeds(args, args.partitions))
+    if args.converge == "volume":
+        return sum(stats.communication_volume(c.with_groups(groups)).values())
+
+    sources, targets = c.edges()
+    return int((groups[sources] != groups[targets]).sum())
+
+
+def fennel(c, args, groups=None):
+    """Stream the gates into args.partitions partitions.
+
+    With args.passes > 1 the gates are restreamed, each pass starting from
+    the previous assignment, until the cut (or simulated makespan, for
+    args.converge == "makespan" or "volume") stops improving. groups
+    warm-starts the first pass from an existing partition instead of an
+    empty one. With args.volume the objective also counts the wires sent
+    between partitions (see wire_savings), not just the edges cut. With
+    args.memory_budget no partition is ever given more garbled table memory
+    than its budget; MemoryBudgetError is raised if the gates cannot be
+    packed.
+    """
+    state = init_state(c, args)
+
+    if state['budgets'] and sum(state['node_memory']) > sum(state['budgets']):
+        raise MemoryBudgetError("The circuit needs " + str(sum(state['node_memory'])) + " memory, the budgets total " +
+                         str(sum(state['budgets'])))
+
+    if groups is not None:
+        if groups.max() >= args.partitions:
+            raise ValueError("Starting partition has more than " + str(args.partitions) + " partitions")
+        for v in gate_order(c).tolist():
+            if groups[v] >= 0:
+                place_gate(c, state, v, groups[v])
+
+    best, best_groups = None, None
+    for i in range(args.passes):
+        stream(c, state, args)
+        groups = state_groups(state)
+        if args.passes == 1:
+            break
+
+        score = partition_score(c, groups, args)
+        if best is not None and score >= best:
+            break
+        best, best_groups = score, groups
+
+    return groups if best_groups is None else best_groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Basic Fennel graph partition algorithm")
+    parser.add_argument("in_json_file", help="Input file location")
+    parser.add_argument("out_json_file", help="Output file location")
+    parser.add_argument("--gamma", default=4, type=float, help="gamma for intra-cluster cost function")
+    parser.add_argument("--and_cost", default=8, type=int, help="AND gate cost")
+    parser.add_argument("--xor_cost", default=2, type=int, help="XOR gate cost")
+    parser.add_argument("--inv_cost", default=1, type=int, help="INV gate cost")
+    parser.add_argument("--partitions", default=3, type=int, help="number of graph partitions")
+    parser.add_argument("--weighted_size", action="store_true")
+    parser.add_argument("--output_influence", action="store_true")
+    parser.add_argument("--volume", action="store_true", help="also minimise the wires sent between partitions")
+    parser.add_argument("--passes", default=1, type=int, help="maximum number of restreaming passes")
+    parser.add_argument("--converge", default="cut", choices=["cut", "makespan", "volume"], help="stop restreaming once this stops improving")
+    parser.add_argument("--init", help="partitioned json file to warm start from")
+    parser.add_argument("--order", default="natural", choices=ORDERS, help="order to stream the gates in")
+    parser.add_argument("--lookahead", default=0, type=int, help="size of the lookahead buffer (0 = place gates as they come)")
+    parser.add_argument("--seed", default=None, type=int, help="random seed for --order random")
+    parser.add_argument("--memory_budget", default=None, type=int, nargs="+", help="memory per partition (cost.py units), one value for all or one per partition")
+    parser.add_argument("--node_speed", default=None, type=float, nargs="+", help="relative speed of each partition's node")
+    parser.add_argument("--node_capacity", default=None, type=float, nargs="+", help="relative capacity of each partition's node (default: its speed)")
+
+    args = parser.parse_args()
+
+    c = circuit.load(args.in_json_file)
+
+    init_groups = None
+    if args.init:
+        init = circuit.load(args.init)
+        # Groups are indexed by node, so the nodes have to be the same ones in the same order
+        if init.n_nodes != c.n_nodes or list(init.names) != list(c.names):
+            parser.error(args.init + " is not a partition of " + args.in_json_file)
+        init_groups = init.groups
+
+    # Do the algorithm
+    try:
+        groups = fennel(c, args, init_groups)
+    except ValueError as e:
+        # Budgets too small for the circuit, or per-node lists of the wrong length
+        parser.error(str(e))
+
+    circuit.dump(c, args.out_json_file, groups)
@@ -0,0 +1,214 @@
+import argparse
+import heapq
+import numpy as np
+
+import circuit
+import fennel
+
+# Stop coarsening at this many vertices per partition
+COARSEST_PER_PARTITION = 20
+# Allowed partition weight above a perfectly even split
+IMBALANCE = 0.05
+REFINE_PASSES = 8
+
+
+def undirected_graph(n, sources, targets, weights):
+    """Symmetric CSR graph, parallel edges merged by summing their weights."""
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    keep = sources != targets
+    src = np.concatenate((sources[keep], targets[keep]))
+    dst = np.concatenate((targets[keep], sources[keep]))
+    w = np.concatenate((weights[keep], weights[keep]))
+
+    keys, inverse = np.unique(src * n + dst, return_inverse=True)
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // n, minlength=n), out=ptr[1:])
+
+    return ptr, keys % n, np.bincount(inverse, w)
+
+
+def heavy_edge_matching(graph, vw, max_vw, rng):
+    """Pair every vertex with its heaviest unmatched neighbour.
+
+    Returns the fine -> coarse vertex map and the number of coarse vertices.
+    """
+    ptr, idx, w = [a.tolist() for a in graph]
+    vw = vw.tolist()
+    n = len(vw)
+
+    match = [-1 for i in range(n)]
+    for v in rng.permutation(n).tolist():
+        if match[v] >= 0:
+            continue
+
+        best, best_w = v, 0
+        for k in range(ptr[v], ptr[v+1]):
+            u = idx[k]
+            if match[u] < 0 and u != v and w[k] > best_w and vw[u] + vw[v] <= max_vw:
+                best, best_w = u, w[k]
+
+        match[v] = best
+        match[best] = v
+
+    cmap = np.full(n, -1, dtype=np.int64)
+    n_coarse = 0
+    for v in range(n):
+        if cmap[v] < 0:
+            cmap[v] = cmap[match[v]] = n_coarse
+            n_coarse += 1
+
+    return cmap, n_coarse
+
+
+def coarsen(graph, vw, cmap, n_coarse):
+    ptr, idx, w = graph
+    sources = np.repeat(np.arange(len(vw)), np.diff(ptr))
+    # Every edge is in the CSR twice, keep one copy
+    once = sources < idx
+    coarse = undirected_graph(n_coarse, cmap[sources[once]], cmap[idx[once]], w[once])
+    return coarse, np.bincount(cmap, vw, minlength=n_coarse)
+
+
+def grow_partitions(graph, vw, n_partitions, rng):
+    """Greedy graph growing: fill one partition at a time with the unassigned
+    vertex most strongly connected to it, starting from a random seed.
+    """
+    ptr, idx, w = [a.tolist() for a in graph]
+    n = len(vw)
+    target = vw.sum() / n_partitions
+
+    part = [-1 for i in range(n)]
+    order = rng.permutation(n).tolist()
+    for p in range(n_partitions - 1):
+        weight = 0
+        conn = {}
+        heap = []
+        while weight < target:
+            if not heap:
+                seed = next((v for v in order if part[v] < 0), None)
+                if seed is None:
+                    break
+                heap = [(0, seed)]
+
+            c, v = heapq.heappop(heap)
+            if part[v] >= 0 or -c != conn.get(v, 0):
+                continue
+
+            part[v] = p
+            weight += vw[v]
+            for k in range(ptr[v], ptr[v+1]):
+                u = idx[k]
+                if part[u] < 0:
+                    conn[u] = conn.get(u, 0) + w[k]
+                    heapq.heappush(heap, (-conn[u], u))
+
+    return np.array([p if p >= 0 else n_partitions - 1 for p in part], dtype=np.int64)
+
+
+def refine(graph, vw, part, n_partitions, max_pw, rng):
+    """Greedy k-way refinement of the boundary vertices.
+
+    A vertex moves to the neighbouring partition that cuts the least edge
+    weight, as long as that partition stays under max_pw. Moves that do not
+    change the cut are made only if they even out the partition weights, and
+    an overweight partition sheds vertices even at a loss.
+    """
+    ptr, idx, w = [a.tolist() for a in graph]
+    vws = vw.tolist()
+    part = part.tolist()
+    pw = np.bincount(part, vw, minlength=n_partitions).tolist()
+    count = np.bincount(part, minlength=n_partitions).tolist()
+
+    for i in range(REFINE_PASSES):
+        moved = 0
+        for v in rng.permutation(len(part)).tolist():
+            a = part[v]
+            conn = {}
+            for k in range(ptr[v], ptr[v+1]):
+                conn[part[idx[k]]] = conn.get(part[idx[k]], 0) + w[k]
+
+            if count[a] == 1 or not conn or (len(conn) == 1 and a in conn):
+                continue
+
+            internal = conn.pop(a, 0)
+            overweight = pw[a] > max_pw
+            best, best_gain = a, None
+            for p in sorted(conn):
+                if pw[p] + vws[v] > max_pw:
+                    continue
+                gain = conn[p] - internal
+                if gain > 0 or overweight or (gain == 0 and pw[p] + vws[v] < pw[a]):
+                    if best_gain is None or gain > best_gain:
+                        best, best_gain = p, gain
+
+            if best != a:
+                part[v] = best
+                pw[a] -= vws[v]
+                pw[best] += vws[v]
+                count[a] -= 1
+                count[best] += 1
+                moved += 1
+
+        if not moved:
+            break
+
+    return np.array(part, dtype=np.int64)
+
+
+def multilevel(c, n_partitions, node_weight, imbalance=IMBALANCE, seed=0):
+    """Multilevel k-way partitioning (Karypis and Kumar '98).
+
+    The circuit, as an undirected graph, is coarsened by heavy-edge matching
+    until about COARSEST_PER_PARTITION vertices per partition remain. The
+    smallest graph is partitioned by greedy graph growing, then the partition
+    is projected back one level at a time and refined at each. Partitions
+    are kept within (1 + imbalance) of an even share of node_weight.
+    """
+    rng = np.random.default_rng(seed)
+    sources, targets = c.edges()
+    graph = undirected_graph(c.n_nodes, sources, targets, c.succ_weight)
+    vw = np.asarray(node_weight, dtype=np.float64)
+
+    coarsest = COARSEST_PER_PARTITION * n_partitions
+    max_pw = (1 + imbalance) * vw.sum() / n_partitions
+
+    levels = []
+    while len(vw) > coarsest:
+        cmap, n_coarse = heavy_edge_matching(graph, vw, max(1.5 * vw.sum() / coarsest, vw.max()), rng)
+        if n_coarse > 0.95 * len(vw):
+            break
+
+        levels.append((graph, vw, cmap))
+        graph, vw = coarsen(graph, vw, cmap, n_coarse)
+
+    part = grow_partitions(graph, vw, n_partitions, rng)
+    part = refine(graph, vw, part, n_partitions, max(max_pw, vw.max()), rng)
+
+    for graph, vw, cmap in reversed(levels):
+        part = refine(graph, vw, part[cmap], n_partitions, max_pw, rng)
+
+    return part.astype(np.int32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multilevel graph partition algorithm")
+    parser.add_argument("in_json_file", help="Input file location")
+    parser.add_argument("out_json_file", help="Output file location")
+    parser.add_argument("--and_cost", default=8, type=int, help="AND gate cost")
+    parser.add_argument("--xor_cost", default=2, type=int, help="XOR gate cost")
+    parser.add_argument("--inv_cost", default=1, type=int, help="INV gate cost")
+    parser.add_argument("--partitions", default=3, type=int, help="number of graph partitions")
+    parser.add_argument("--weighted_size", action="store_true", help="balance gate costs instead of node counts")
+    parser.add_argument("--imbalance", default=IMBALANCE, type=float, help="allowed partition size above an even split")
+    parser.add_argument("--seed", default=0, type=int, help="random seed")
+
+    args = parser.parse_args()
+
+    c = circuit.load(args.in_json_file)
+
+    groups = multilevel(c, args.partitions, fennel.node_sizes(args, c), args.imbalance, args.seed)
+
+    circuit.dump(c, args.out_json_file, groups)
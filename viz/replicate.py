@@ -0,0 +1,134 @@
+import argparse
+import numpy as np
+
+import circuit
+import critpath
+import stats
+
+# Extra work each partition may take on, as a fraction of its own
+BUDGET = 0.05
+# Most gates copied to save one wire
+MAX_CONE = 4
+
+
+def replicate(c, groups, budget=BUDGET, max_cone=MAX_CONE, max_cost=stats.XOR_COST):
+    """Copy cheap gates into the partitions that read their wire.
+
+    Gates are taken in circuit order. For every remote partition reading a
+    gate of at most max_cost ticks, the gate is copied there together with
+    the cheap gates of its input cone that the partition cannot already see
+    (up to max_cone gates in all). A cone is only copied if each of its other
+    inputs is an input bit or already in (or sent to) that partition, so
+    every copy removes a wire from the network and adds none. A partition
+    takes on at most budget times its own work in copies.
+
+    Returns {node: set of partitions holding an extra copy}.
+    """
+    costs = critpath.gate_costs(c).tolist()
+    types = c.types.tolist()
+    groups = groups.tolist()
+    succ_ptr = c.succ_ptr.tolist()
+    succ_idx = c.succ_idx.tolist()
+    pred_ptr = c.pred_ptr.tolist()
+    pred_idx = c.pred_idx.tolist()
+
+    n_partitions = max(groups + [0]) + 1
+    work = [0 for i in range(n_partitions)]
+    for v in range(c.n_nodes):
+        work[groups[v]] += costs[v]
+    extra = [0 for i in range(n_partitions)]
+
+    copies = {}
+
+    def holds(v, p):
+        return groups[v] == p or p in copies.get(v, ())
+
+    def readers(v):
+        # Partitions with a gate (or copy of one) reading v's wire
+        ps = set()
+        for s in succ_idx[succ_ptr[v]:succ_ptr[v+1]]:
+            if types[s] != circuit.OUTPUT:
+                ps.add(groups[s])
+                ps.update(copies.get(s, ()))
+        return ps
+
+    def input_cone(g, p):
+        cone = [g]
+        seen = set(cone)
+        i = 0
+        while i < len(cone):
+            h = cone[i]
+            i += 1
+            for u in pred_idx[pred_ptr[h]:pred_ptr[h+1]]:
+                if u in seen or types[u] == circuit.INPUT or holds(u, p) or p in readers(u):
+                    continue
+                if costs[u] > max_cost or len(cone) >= max_cone:
+                    return None
+                seen.add(u)
+                cone.append(u)
+        return cone
+
+    for g in range(c.n_nodes):
+        if costs[g] == 0 or costs[g] > max_cost:
+            continue
+
+        for p in sorted(readers(g)):
+            if holds(g, p):
+                continue
+
+            cone = input_cone(g, p)
+            if cone is None:
+                continue
+            cost = sum(costs[h] for h in cone)
+            if extra[p] + cost > budget * work[p]:
+                continue
+
+            for h in cone:
+                copies.setdefault(h, set()).add(p)
+            extra[p] += cost
+
+    return copies
+
+
+def wires_sent(c, groups, copies):
+    """Wires sent between partitions once the copies are in place, counted
+    like stats.communication_volume."""
+    types = c.types.tolist()
+    groups = groups.tolist()
+    succ_ptr = c.succ_ptr.tolist()
+    succ_idx = c.succ_idx.tolist()
+
+    total = 0
+    for v in range(c.n_nodes):
+        if types[v] == circuit.INPUT:
+            continue
+        readers = set()
+        for s in succ_idx[succ_ptr[v]:succ_ptr[v+1]]:
+            if types[s] != circuit.OUTPUT:
+                readers.add(groups[s])
+                readers.update(copies.get(s, ()))
+        total += len(readers - {groups[v]} - copies.get(v, set()))
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy cheap gates into the partitions that read them")
+    parser.add_argument("in_json_file", help="Partitioned graph json")
+    parser.add_argument("out_json_file", help="Output file location, for partition/emit.py")
+    parser.add_argument("--budget", default=BUDGET, type=float, help="extra work per partition, as a fraction of its own")
+    parser.add_argument("--max_cone", default=MAX_CONE, type=int, help="most gates copied to save one wire")
+    parser.add_argument("--max_cost", default=stats.XOR_COST, type=int, help="most expensive gate (in ticks) that may be copied")
+
+    args = parser.parse_args()
+
+    c = circuit.load(args.in_json_file)
+    groups = np.maximum(c.groups, 0)
+
+    copies = replicate(c, groups, args.budget, args.max_cone, args.max_cost)
+
+    costs = critpath.gate_costs(c)
+    print("Wires sent:", wires_sent(c, groups, {}), "->", wires_sent(c, groups, copies))
+    print("Copies:", sum(len(ps) for ps in copies.values()), "gate(s),",
+          sum(int(costs[v]) * len(ps) for v, ps in copies.items()), "extra tick(s) of work")
+
+    circuit.dump(c, args.out_json_file, groups, copies)
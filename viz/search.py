@@ -0,0 +1,195 @@
+import itertools
+import math
+import random
+
+import numpy as np
+
+GAMMA_RANGE = (1.0, 8.0)
+CLUSTER_RANGE = (3, 32)
+
+
+def config_key(config):
+    return (config["gamma"], config["clusters"], config["algorithm"], config.get("fraction", 1.0))
+
+
+class RandomSearch:
+    """Uniformly random knobs, never repeating a configuration."""
+
+    def __init__(self, algorithms, budget, seed=None):
+        self.algorithms = algorithms
+        self.rng = random.Random(seed)
+        self.tried = set()
+
+    def random_config(self):
+        return {
+            "gamma": self.rng.uniform(*GAMMA_RANGE),
+            "clusters": self.rng.randint(*CLUSTER_RANGE),
+            "algorithm": self.rng.choice(self.algorithms),
+        }
+
+    def propose(self):
+        config = self.random_config()
+        while config_key(config) in self.tried:
+            config = self.random_config()
+        self.tried.add(config_key(config))
+        return config
+
+    def observe(self, config, ticks):
+        pass
+
+
+class SuccessiveHalving(RandomSearch):
+    """Successive halving over random configurations.
+
+    Rung r evaluates its configurations on the first eta**(r - rungs + 1) of
+    the circuit's gates, and only the best 1/eta of each rung move on to the
+    next one. The last rung is the full circuit. The number of starting
+    configurations is picked so that all rungs together fit the budget.
+    """
+
+    def __init__(self, algorithms, budget, seed=None, eta=3, rungs=3):
+        super().__init__(algorithms, budget, seed)
+        self.eta = eta
+        self.rungs = rungs
+
+        n = max(1, int(budget / sum(eta**-r for r in range(rungs))))
+        self.rung = 0
+        self.queue = [super(SuccessiveHalving, self).propose() for i in range(n)]
+        self.outstanding = 0
+        self.results = []
+
+    def fraction(self):
+        return float(self.eta) ** (self.rung - self.rungs + 1)
+
+    def propose(self):
+        if not self.queue:
+            if self.outstanding or not self.results or self.rung == self.rungs - 1:
+                return None
+
+            # Promote the best 1/eta of this rung
+            self.results.sort(key=lambda r: r[0])
+            keep = max(1, len(self.results) // self.eta)
+            self.queue = [config for _, config in self.results[:keep]]
+            self.results = []
+            self.rung += 1
+
+        config = dict(self.queue.pop(0))
+        config["fraction"] = self.fraction()
+        self.outstanding += 1
+        return config
+
+    def observe(self, config, ticks):
+        self.outstanding -= 1
+        config = {k: v for k, v in config.items() if k != "fraction"}
+        self.results.append((ticks, config))
+
+
+class GridRefine:
+    """Coarse grid over the knobs, then finer grids around the best points.
+
+    Each refinement halves the gamma and cluster steps and proposes the
+    neighbours of the top configurations found so far.
+    """
+
+    def __init__(self, algorithms, budget, seed=None, gamma_points=4, cluster_points=4, top=3):
+        self.algorithms = algorithms
+        self.top = top
+        self.gamma_step = (GAMMA_RANGE[1] - GAMMA_RANGE[0]) / (gamma_points - 1)
+        self.cluster_step = (CLUSTER_RANGE[1] - CLUSTER_RANGE[0]) / (cluster_points - 1)
+
+        gammas = np.linspace(*GAMMA_RANGE, gamma_points)
+        clusters = np.linspace(*CLUSTER_RANGE, cluster_points)
+        self.queue = [{"gamma": float(g), "clusters": int(round(k)), "algorithm": a}
+                      for g, k, a in itertools.product(gammas, clusters, algorithms)]
+        self.tried = set(config_key(c) for c in self.queue)
+        self.outstanding = 0
+        self.results = []
+
+    def refine(self):
+        self.gamma_step /= 2
+        self.cluster_step /= 2
+
+        self.results.sort(key=lambda r: r[0])
+        for _, config in self.results[:self.top]:
+            for dg, dk in itertools.product((-1, 0, 1), repeat=2):
+                gamma = min(max(config["gamma"] + dg * self.gamma_step, GAMMA_RANGE[0]), GAMMA_RANGE[1])
+                clusters = min(max(int(round(config["clusters"] + dk * self.cluster_step)), CLUSTER_RANGE[0]), CLUSTER_RANGE[1])
+                neighbour = {"gamma": gamma, "clusters": clusters, "algorithm": config["algorithm"]}
+                if config_key(neighbour) not in self.tried:
+                    self.tried.add(config_key(neighbour))
+                    self.queue.append(neighbour)
+
+    def propose(self):
+        if not self.queue:
+            if self.outstanding or not self.results:
+                return None
+            self.refine()
+            if not self.queue:
+                return None
+
+        self.outstanding += 1
+        return self.queue.pop(0)
+
+    def observe(self, config, ticks):
+        self.outstanding -= 1
+        self.results.append((ticks, config))
+
+
+class Surrogate(RandomSearch):
+    """Quadratic least-squares model of log ticks over the knobs.
+
+    After n_init random configurations, each proposal is the best predicted
+    of n_candidates random ones, except for an explore fraction of random
+    proposals.
+    """
+
+    def __init__(self, algorithms, budget, seed=None, n_init=8, n_candidates=500, explore=0.2):
+        super().__init__(algorithms, budget, seed)
+        self.n_init = n_init
+        self.n_candidates = n_candidates
+        self.explore = explore
+        self.X = []
+        self.y = []
+
+    def features(self, config):
+        g = (config["gamma"] - GAMMA_RANGE[0]) / (GAMMA_RANGE[1] - GAMMA_RANGE[0])
+        k = (config["clusters"] - CLUSTER_RANGE[0]) / (CLUSTER_RANGE[1] - CLUSTER_RANGE[0])
+        onehot = [1.0 if config["algorithm"] == a else 0.0 for a in self.algorithms]
+        return [g, k, g * g, k * k, g * k] + onehot
+
+    def propose(self):
+        if len(self.y) < self.n_init or self.rng.random() < self.explore:
+            return super().propose()
+
+        X = np.array(self.X)
+        y = np.array(self.y)
+        # A little ridge regularisation keeps the fit sane with few points
+        w = np.linalg.solve(X.T @ X + 1e-3 * np.eye(X.shape[1]), X.T @ y)
+
+        candidates = [self.random_config() for i in range(self.n_candidates)]
+        candidates = [c for c in candidates if config_key(c) not in self.tried] or [super().propose()]
+        predicted = np.array([self.features(c) for c in candidates]) @ w
+
+        config = candidates[int(np.argmin(predicted))]
+        self.tried.add(config_key(config))
+        return config
+
+    def observe(self, config, ticks):
+        if math.isinf(ticks):
+            # Over the memory budget: nothing to fit, so as bad as the worst so far
+            if not self.y:
+                return
+            self.X.append(self.features(config))
+            self.y.append(max(self.y))
+            return
+
+        self.X.append(self.features(config))
+        self.y.append(math.log1p(ticks))
+
+
+STRATEGIES = {
+    "random": RandomSearch,
+    "halving": SuccessiveHalving,
+    "grid": GridRefine,
+    "surrogate": Surrogate,
+}
@@ -1,155 +1,515 @@
 import argparse
-import json
+import collections
+import heapq
+import itertools
+import math
 import networkx as nx
-from itertools import permutations 
+import numpy as np
 from collections import Counter
 import sys
 
-def to_networkx(graph_json):
-    G = nx.DiGraph()
-
-    node_group_map = {}
-    for n in graph["nodes"]:
-        G.add_node((n["id"], n["group"]))
-        node_group_map[n["id"]] = n["group"]
-
-    for l in graph["links"]:
-        G.add_edge(
-            (l["source"], node_group_map[l["source"]]),
-            (l["target"], node_group_map[l["target"]]), 
-            weight=l["value"]
-        )
+import circuit
+
+
+def get_subclusters(c):
+    """Split every cluster into its connected pieces.
+
+    Returns a node -> sub-cluster index array and the members of each
+    sub-cluster in node order. Sub-clusters are numbered by their lowest
+    node, so numbering follows node order.
+    """
+    groups = c.groups
+    parent = list(range(c.n_nodes))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    # Union-find over the edges that stay inside a cluster, the root of each
+    # set is always its lowest node
+    sources, targets = c.edges()
+    same = groups[sources] == groups[targets]
+    for s, t in zip(sources[same].tolist(), targets[same].tolist()):
+        rs, rt = find(s), find(t)
+        if rs < rt:
+            parent[rt] = rs
+        elif rt < rs:
+            parent[rs] = rt
+
+    roots = np.array([find(n) for n in range(c.n_nodes)], dtype=np.int64)
+    _, sc_idx = np.unique(roots, return_inverse=True)
+    sc_idx = sc_idx.astype(np.int32)
+
+    order = np.argsort(sc_idx, kind="stable")
+    bounds = np.cumsum(np.bincount(sc_idx))[:-1]
+    subclusters = np.split(order, bounds) if c.n_nodes else []
+
+    return sc_idx, subclusters
+
+
+def subcluster_depths(c, sc_idx, n_subclusters):
+    """Longest path (in nodes) inside each sub-cluster, in one pass.
+
+    Paths are weighted by link value like networkx's dag_longest_path; the
+    path ends at the first node in topological order with the largest
+    weight, and a node always extends the heaviest path into it.
+    """
+    groups = c.groups
+    succ_ptr = c.succ_ptr.tolist()
+    succ_idx = c.succ_idx.tolist()
+    succ_weight = c.succ_weight.tolist()
+    groups_l = groups.tolist()
+
+    sources, targets = c.edges()
+    indegree = np.bincount(targets[groups[sources] == groups[targets]], minlength=c.n_nodes).tolist()
+
+    dist = [None for i in range(c.n_nodes)]
+    length = [1 for i in range(c.n_nodes)]
+    best = [None for i in range(n_subclusters)]
+    depths = [0 for i in range(n_subclusters)]
+
+    queue = collections.deque(n for n in range(c.n_nodes) if indegree[n] == 0)
+    while queue:
+        v = queue.popleft()
+        if dist[v] is None:
+            dist[v] = 0
+
+        sc = sc_idx[v]
+        if best[sc] is None or dist[v] > best[sc]:
+            best[sc] = dist[v]
+            depths[sc] = length[v]
+
+        for k in range(succ_ptr[v], succ_ptr[v+1]):
+            post = succ_idx[k]
+            if groups_l[post] != groups_l[v]:
+                continue
 
-    return G
+            d = dist[v] + succ_weight[k]
+            if dist[post] is None or d > dist[post]:
+                dist[post] = d
+                length[post] = length[v] + 1
 
+            indegree[post] -= 1
+            if indegree[post] == 0:
+                queue.append(post)
 
-def get_subclusters(G):
-    nodes_seen = set()
-    sub_clusters = []
+    return depths
 
-    for n in G:
-        if n in nodes_seen:
-            continue
 
-        cluster_num = n[1]
+AND_COST = 331
+XOR_COST = 41
+INV_COST = 41
 
-        unexplored_nodes = set()
-        unexplored_nodes.add(n)
+GATE_COSTS = {
+    circuit.AND: AND_COST,
+    circuit.XOR: XOR_COST,
+    circuit.INV: INV_COST,
+}
 
-        sub_cluster = []
+# Garbled table memory per gate (cost.py's model), input/output bits are free
+MEMORY_COSTS = {
+    circuit.AND: 237,
+    circuit.XOR: 32,
+    circuit.INV: 32,
+}
+
+
+def gate_memory(c):
+    memory = np.zeros(len(circuit.GATE_TYPE_NAMES), dtype=np.int64)
+    for t, cost in MEMORY_COSTS.items():
+        memory[t] = cost
+    return memory[c.types]
+
+
+def cluster_memory(c, n_clusters):
+    return np.bincount(np.maximum(c.groups, 0), gate_memory(c), minlength=n_clusters).astype(np.int64)
+
+
+def per_cluster(values, n_clusters, what):
+    """Per-cluster values from a command line list: one value is every
+    cluster's, otherwise there must be one per cluster. Returns None without
+    values."""
+    if not values:
+        return None
+    if min(values) <= 0:
+        raise ValueError(what[0].upper() + what[1:] + " must be positive")
+    if len(values) == 1:
+        return [values[0]] * n_clusters
+    if len(values) != n_clusters:
+        raise ValueError(str(len(values)) + " " + what + " for " + str(n_clusters) + " clusters")
+    return list(values)
+
+
+def cluster_count(c, *per_node):
+    """Clusters of a partitioned circuit: one past its highest group, or as
+    many as a per-node list from the command line names, whichever is more.
+    The partitioner may leave the last clusters empty."""
+    n_clusters = int(c.groups.max()) + 1
+    for values in per_node:
+        if values and len(values) > 1:
+            n_clusters = max(n_clusters, len(values))
+    return n_clusters
+
+
+def memory_budgets(budget, n_clusters):
+    return per_cluster(budget, n_clusters, "memory budgets")
+
+
+def node_speeds(args, n_clusters):
+    # Relative speed of the machine running each cluster, None if all equal
+    return per_cluster(args.node_speed, n_clusters, "node speeds")
+
+
+def scaled_cost(cost, speed):
+    # Ticks a gate of cost ticks takes on a node of the given relative speed
+    return int(math.ceil(cost / speed))
+
+
+def network_model(args):
+    """Cost of moving wires between clusters, in ticks.
+
+    A message on link i -> j occupies the link for msg_overhead plus
+    ceil(wires / bandwidth) ticks (bandwidth in wires per tick, 0 means
+    unlimited) and arrives latency ticks after that. Without batching every
+    wire is its own message; with a batch_window of W ticks, the wires a
+    cluster produces for the same destination are held and sent together at
+    the next multiple of W. Returns None for a free network.
+    """
+    network = {
+        'latency': args.latency,
+        'overhead': args.msg_overhead,
+        'bandwidth': args.bandwidth,
+        'batch_window': args.batch_window,
+        'messages': 0,
+        'wires': 0,
+    }
+
+    if not (args.latency or args.msg_overhead or args.bandwidth or args.batch_window):
+        return None
+
+    return network
+
+
+# Event kinds, in the order they are handled within a tick
+ARRIVE = 0
+WAKE = 1
+FLUSH = 2
+
+
+def simulate(c, clusters, n_clusters, network=None, cutoff=None, instances=1, trace=None, speeds=None):
+    """Discrete-event gate evaluation schedule.
+
+    Each cluster evaluates one gate at a time, always picking its earliest
+    (lowest index) gate whose non-input predecessors have completed. Time
+    only advances to the next event, and clusters that free up at the same
+    tick are handled in cluster order, exactly like the old tick-by-tick
+    loop. With a network model (see network_model), a gate waits for its
+    remote inputs to arrive rather than for their gates to complete.
+    Returns the tick at which the last gate completes, or None as soon as
+    the schedule runs past cutoff.
+
+    instances independent copies of the circuit are evaluated back to back,
+    all inputs available from the start. Gate g of instance k is numbered
+    k * n_nodes + g, so a cluster prefers earlier instances and moves on to
+    the next one as soon as it runs out of work on the current one. A trace
+    dict is filled with each instance's completion tick ('completions'), the
+    ticks each cluster spent evaluating ('busy') and the tick each cluster
+    last finished a gate ('last_busy').
+
+    speeds gives each cluster's relative speed; a gate takes its cost
+    divided by the speed (rounded up) there.
+    """
+    types = c.types
+    gate_costs = np.zeros(len(circuit.GATE_TYPE_NAMES), dtype=np.int64)
+    for t, cost in GATE_COSTS.items():
+        gate_costs[t] = cost
+    costs = gate_costs[types].tolist()
+
+    is_gate = (types != circuit.INPUT) & (types != circuit.OUTPUT)
+    bad = np.flatnonzero(is_gate & (gate_costs[types] == 0))
+    if len(bad):
+        print("Bad gate label", c.names[bad[0]])
+        exit(1)
+
+    # Number of predecessors that still have to complete before each gate can start
+    sources, targets = c.edges()
+    waiting = np.bincount(targets[types[sources] != circuit.INPUT], minlength=c.n_nodes).tolist()
+
+    n = c.n_nodes
+    clusters = clusters.tolist()
+    is_gate = is_gate.tolist()
+    succ_ptr = c.succ_ptr.tolist()
+    succ_idx = c.succ_idx.tolist()
+
+    # In increasing order, so every list is already a heap
+    ready = [[] for i in range(n_clusters)]
+    for k in range(instances):
+        for g in range(n):
+            if is_gate[g] and waiting[g] == 0:
+                ready[clusters[g]].append(k * n + g)
+    waiting = waiting * instances
+
+    completions = [0 for k in range(instances)]
+    busy = [0 for i in range(n_clusters)]
+    last_busy = [0 for i in range(n_clusters)]
+
+    running = [None for i in range(n_clusters)]
+    # (tick, kind, cluster, seq, gates)
+    events = []
+    seq = itertools.count()
+
+    if network:
+        network['messages'], network['wires'] = 0, 0
+        link_free = {}
+        batches = {}
+
+    def send(i, j, tick, gates, n_wires):
+        start = max(tick, link_free.get((i, j), 0))
+        duration = network['overhead']
+        if network['bandwidth']:
+            duration += math.ceil(n_wires / network['bandwidth'])
+        link_free[(i, j)] = start + duration
+        network['messages'] += 1
+        network['wires'] += n_wires
+        return start + duration + network['latency']
+
+    def release(post):
+        waiting[post] -= 1
+        if waiting[post] != 0:
+            return None
+
+        j = clusters[post % n]
+        heapq.heappush(ready[j], post)
+        return j if running[j] is None else None
 
-        while unexplored_nodes:
-            curr_node = unexplored_nodes.pop()
-            if curr_node[1] != cluster_num:
+    tick = 0
+    last_tick = 0
+    to_check = list(range(n_clusters))
+    while True:
+        heapq.heapify(to_check)
+        checking = set(to_check)
+
+        while to_check:
+            i = heapq.heappop(to_check)
+
+            g = running[i]
+            if g is not None:
+                running[i] = None
+                last_tick = tick
+
+                base = g - g % n
+                v = g - base
+                completions[base // n] = tick
+
+                remote = {}
+                for post in succ_idx[succ_ptr[v]:succ_ptr[v+1]]:
+                    if not is_gate[post]:
+                        continue
+                    if network and clusters[post] != i:
+                        remote.setdefault(clusters[post], []).append(base + post)
+                        continue
+                    post += base
+
+                    # An idle cluster notices the new gate this tick if it
+                    # has not been looked at yet, otherwise on the next one
+                    j = release(post)
+                    if j is not None and j != i:
+                        if j > i:
+                            if j not in checking:
+                                checking.add(j)
+                                heapq.heappush(to_check, j)
+                        else:
+                            heapq.heappush(events, (tick + 1, WAKE, j, next(seq), None))
+
+                # The output wire goes to each remote cluster once
+                for j, gates in remote.items():
+                    if network['batch_window']:
+                        if (i, j) not in batches:
+                            window = network['batch_window']
+                            heapq.heappush(events, (-(-tick // window) * window, FLUSH, i, next(seq), j))
+                            batches[(i, j)] = []
+                        batches[(i, j)].append(gates)
+                    else:
+                        arrival = send(i, j, tick, gates, 1)
+                        heapq.heappush(events, (arrival, ARRIVE, j, next(seq), gates))
+
+            if running[i] is None and ready[i]:
+                g = heapq.heappop(ready[i])
+                running[i] = g
+                cost = costs[g % n]
+                if speeds:
+                    cost = scaled_cost(cost, speeds[i])
+                busy[i] += cost
+                last_busy[i] = tick + cost
+                heapq.heappush(events, (tick + cost, WAKE, i, next(seq), None))
+
+        # Batches are flushed once every cluster has had its turn this tick
+        while events and events[0][0] == tick and events[0][1] == FLUSH:
+            _, _, i, _, j = heapq.heappop(events)
+            wires = batches.pop((i, j))
+            gates = [post for w in wires for post in w]
+            arrival = send(i, j, tick, gates, len(wires))
+            if arrival > tick:
+                heapq.heappush(events, (arrival, ARRIVE, j, next(seq), gates))
                 continue
 
-            nodes_seen.add(curr_node)
-            sub_cluster.append(curr_node)
+            for post in gates:
+                j = release(post)
+                if j is not None:
+                    heapq.heappush(events, (tick + 1, WAKE, j, next(seq), None))
+
+        if not events:
+            break
+
+        tick = events[0][0]
+        if cutoff is not None and tick > cutoff:
+            return None
+
+        woken = set()
+        while events and events[0][0] == tick and events[0][1] != FLUSH:
+            _, kind, i, _, gates = heapq.heappop(events)
+            if kind == ARRIVE:
+                for post in gates:
+                    j = release(post)
+                    if j is not None:
+                        woken.add(j)
+            else:
+                woken.add(i)
+        to_check = list(woken)
+
+    if trace is not None:
+        trace['completions'] = completions
+        trace['busy'] = busy
+        trace['last_busy'] = last_busy
+
+    return last_tick
+
+
+def rough_sim(args, c, out, distributed=True):
+
+    network = None
+    if distributed:
+        network = network_model(args)
+        n_clusters = cluster_count(c, args.node_speed)
+        tick = simulate(c, np.maximum(c.groups, 0), n_clusters, network, speeds=node_speeds(args, n_clusters))
+    else:
+        tick = simulate(c, np.zeros(c.n_nodes, dtype=np.int32), 1)
 
-            for pre in G.predecessors(curr_node):
-                if pre not in nodes_seen:
-                    unexplored_nodes.add(pre)
+    if args.verbose:
+        print('gate eval simulation ticks (distributed=' + str(distributed) +'):\t', tick, file = out)
+        if network:
+            print('\tnetwork messages:', network['messages'], '| wires sent:', network['wires'], file = out)
+    else:
+        print(tick, file = out)
 
-            for post in G.successors(curr_node):
-                if post not in nodes_seen:
-                    unexplored_nodes.add(post)
 
-        sub_clusters.append(sub_cluster)
+def throughput(args, c, out):
+    """Pipeline args.instances instances through the partitioned circuit.
 
-    return sub_clusters
+    Fill is the latency of the first instance, the steady state interval
+    the mean time between the completions that follow it, and drain the
+    time from the first cluster running out of work to the last completion.
+    """
+    n_clusters = cluster_count(c, args.node_speed)
+    trace = {}
+    end = simulate(c, np.maximum(c.groups, 0), n_clusters, network_model(args), instances=args.instances, trace=trace,
+                   speeds=node_speeds(args, n_clusters))
 
+    completions = trace['completions']
+    fill = completions[0]
+    if len(completions) > 1:
+        interval = (completions[-1] - completions[0]) / (len(completions) - 1)
+    else:
+        interval = fill
+    per_second = 1 / (interval * args.tick_seconds) if interval else float("inf")
+    drain = end - min(trace['last_busy'])
 
-def get_subcluster_idx(subclusters, n):
-    for i, s in enumerate(subclusters):
-        for pair in s:
-            if n == pair[0]:
-                return i
+    if not args.verbose:
+        print(per_second, file = out)
+        print(interval, file = out)
+        print(fill, file = out)
+        print(drain, file = out)
+        return
+
+    print("--- Throughput (" + str(args.instances) + " instances) ---", file = out)
+    print("Steady state:", "{:.1f}".format(interval), "ticks per instance,", "{:.4g}".format(per_second), "instances per second", file = out)
+    print("Pipeline fill:", fill, "ticks | drain:", drain, "ticks | total:", end, "ticks", file = out)
+    for i, b in enumerate(trace['busy']):
+        print(str(i)+") utilisation", "{:.1f}%".format(100.0 * b / end if end else 0), file = out)
+
+
+def cross_cluster_edges(c):
+    sources, targets = c.edges()
+    cross = c.groups[sources] != c.groups[targets]
+    return sources[cross].tolist(), targets[cross].tolist()
+
+
+def communication_volume(c):
+    """Wires that have to be sent between clusters: every distinct wire
+    counts once per remote cluster reading it, however many gates there
+    read it. Input and output bits are not sent, like in partition.cpp's
+    metadata. Returns {(from cluster, to cluster): wires}.
+    """
+    sources, targets = c.edges()
+    groups = c.groups.astype(np.int64)
+    cross = (groups[sources] != groups[targets]) & (c.types[sources] != circuit.INPUT) & (c.types[targets] != circuit.OUTPUT)
+
+    sent = np.unique(np.stack((c.wires()[cross], groups[sources[cross]], groups[targets[cross]])), axis=1)
+    return Counter(zip(sent[1].tolist(), sent[2].tolist()))
+
+
+def volume_stats(args, c, out):
+    # The verbose breakdown is part of stats(); the total goes after the tick
+    # lines, which keep the positions they always had
+    if not args.verbose:
+        print(sum(communication_volume(c).values()), file = out)
 
 
-AND_COST = 331
-XOR_COST = 41
-INV_COST = 41
+def memory_stats(args, c, out):
+    # Garbled table memory of each cluster against its budget, if there is one
+    budgets = memory_budgets(args.memory_budget, cluster_count(c, args.memory_budget))
+    if budgets is None:
+        return
 
-def _schedule_gates(cluster_states, completed_gates):
-    for state in cluster_states:
-        if state['exec_remaining'] != 0:
-            continue
-
-        if state['current_gate']:
-            completed_gates.append(state['current_gate'])
-
-        state['current_gate'] = None
-        for g in state['gates']:
-            flag = True
-            for pre in G.predecessors(g):
-                if not (pre in completed_gates or "INPUT" in pre[0]):
-                    flag = False
-
-            if flag:
-                state['gates'].remove(g)
-                state['current_gate'] = g
-                if 'AND' in g[0]:
-                    state['exec_remaining'] = AND_COST
-                elif 'XOR' in g[0]:
-                    state['exec_remaining'] = XOR_COST
-                elif 'INV' in g[0]:
-                    state['exec_remaining'] = INV_COST
-                else:
-                    print("Bad gate label", g[0])
-                    exit(1)
-
-                break
-
-
-def rough_sim(args, G, out, distributed=True):
-
-    n_clusters = max([n[1] for n in G]) + 1
-    cluster_states = [{'current_gate': None, 'exec_remaining': 0, 'gates': []} for i in range(n_clusters)]
-
-    n_gates_to_execute = 0
-    for n in G:
-        if "INPUT" in n[0] or "OUTPUT" in n[0]:
-            continue
-        cluster = n[1] if distributed else 0
-        cluster_states[cluster]['gates'].append(n)
-        n_gates_to_execute += 1
-
-    completed_gates = [] 
-    _schedule_gates(cluster_states, completed_gates)
+    used = cluster_memory(c, len(budgets)).tolist()
+    if not args.verbose:
+        print(max(u / b for u, b in zip(used, budgets)), file = out)
+        return
 
-    tick = 0
-    while len(completed_gates) != n_gates_to_execute:
-        for s in cluster_states:
-            if s['current_gate']:
-                s['exec_remaining'] -= 1
+    print("--- Memory ---", file = out)
+    for i, (u, b) in enumerate(zip(used, budgets)):
+        print(str(i)+")", u, "/", b, "({:.1f}%)".format(100.0 * u / b) + (" OVER BUDGET" if u > b else ""), file = out)
+    print('\n', file = out)
 
-        _schedule_gates(cluster_states, completed_gates)
-        tick += 1
 
+def stats(args, c, out):
     if args.verbose:
-        print('gate eval simulation ticks (distributed=' + str(distributed) +'):\t', tick, file = out)
-    else:
-        print(tick, file = out)
+        print('\n', file = out)
 
+    names, groups, types = c.names, c.groups, c.types
 
-def stats(args, G, out):
-    if args.verbose:
-        print('\n', file = out)
-    
-    subclusters = get_subclusters(G)
-    counter = Counter([sc[0][1] for sc in subclusters])
+    sc_idx, subclusters = get_subclusters(c)
+    sc_idx = sc_idx.tolist()
+    sc_cluster = [groups[sc[0]] for sc in subclusters]
+    counter = Counter(sc_cluster)
     if args.verbose:
+        cluster_subclusters = {}
+        for i, cluster_n in enumerate(sc_cluster):
+            cluster_subclusters.setdefault(cluster_n, []).append(i)
+
         print("--- Cluster Summary ---", file = out)
         for cluster_n in counter:
-            nodes = sum([len(sc) for sc in subclusters if sc[0][1] == cluster_n])
+            nodes = sum([len(subclusters[i]) for i in cluster_subclusters[cluster_n]])
             print(str(cluster_n)+")", nodes, "nodes ["+str(counter[cluster_n])+" subcluster(s)]", file = out)
-            for i, sc in enumerate(subclusters):
-                if sc[0][1] != cluster_n:
-                    continue
-                print("\tSub-cluster", str(i)+":", len(sc), "node(s)", file = out)
+            for i in cluster_subclusters[cluster_n]:
+                print("\tSub-cluster", str(i)+":", len(subclusters[i]), "node(s)", file = out)
         print('\n', file = out)
 
-    counter = Counter([(e[0][1], e[1][1]) for e in G.edges() if e[0][1] != e[1][1]])
+    cross_sources, cross_targets = cross_cluster_edges(c)
+
+    counter = Counter([(groups[s], groups[t]) for s, t in zip(cross_sources, cross_targets)])
     if not args.verbose:
         print(sum(counter.values()), file = out)
     else:
@@ -159,7 +519,15 @@ def stats(args, G, out):
             print("\t"+str(e_count[0])+" -> "+str(e_count[1])+":", counter[e_count], "edge(s)", file = out)
         print('\n', file = out)
 
-        counter = Counter([(get_subcluster_idx(subclusters, e[0][0]), get_subcluster_idx(subclusters, e[1][0])) for e in G.edges() if e[0][1] != e[1][1]])
+        volume = communication_volume(c)
+        print("Communication volume:", sum(volume.values()), "wire(s)", file = out)
+        for e_count in volume:
+            print("\t"+str(e_count[0])+" -> "+str(e_count[1])+":", volume[e_count], "wire(s)", file = out)
+        print('\n', file = out)
+
+    if args.verbose:
+
+        counter = Counter([(sc_idx[s], sc_idx[t]) for s, t in zip(cross_sources, cross_targets)])
         print("Total cross-sub-cluster edge(s):", sum(counter.values()), file = out)
 
         subcluster_G = nx.DiGraph()
@@ -167,7 +535,7 @@ def stats(args, G, out):
             subcluster_G.add_node(i)
 
         for e_count in counter:
-            print("\t"+str(e_count[0])+" (cluster " + str(subclusters[e_count[0]][0][1]) + ") -> "+str(e_count[1])+" (cluster " + str(subclusters[e_count[1]][0][1]) + "):", counter[e_count], "edge(s)", file = out)
+            print("\t"+str(e_count[0])+" (cluster " + str(sc_cluster[e_count[0]]) + ") -> "+str(e_count[1])+" (cluster " + str(sc_cluster[e_count[1]]) + "):", counter[e_count], "edge(s)", file = out)
             subcluster_G.add_edge(e_count[0], e_count[1])
 
         print('\n', file = out)
@@ -175,13 +543,15 @@ def stats(args, G, out):
             path = nx.dag_longest_path(subcluster_G)
             print("Longest sub-cluster path:", path, "(length =", str(len(path))+")", file = out)
         except:
-            print("Sub-cluster graph has cycles", file = out) 
+            print("Sub-cluster graph has cycles", file = out)
         print('\n', file = out)
 
+        depths = subcluster_depths(c, sc_idx, len(subclusters))
+
         for i, sc in enumerate(subclusters):
             print("--- Sub-cluster", i, "Summary ---", file = out)
 
-            cluster_num = sc[0][1]
+            cluster_num = sc_cluster[i]
 
             n_inputs = 0
             n_outputs = 0
@@ -190,33 +560,32 @@ def stats(args, G, out):
             incoming_edges = []
             outgoing_edges = []
 
-            for gate in sc:
-                if "INPUT" in gate[0]:
+            for gate in sc.tolist():
+                if types[gate] == circuit.INPUT:
                     n_inputs += 1
-                elif "OUTPUT" in gate[0]:
+                elif types[gate] == circuit.OUTPUT:
                     n_outputs += 1
-                elif "AND" in gate[0]:
+                elif types[gate] == circuit.AND:
                     n_and += 1
-                elif "XOR" in gate[0]:
+                elif types[gate] == circuit.XOR:
                     n_xor += 1
-                elif "INV" in gate[0]:
+                elif types[gate] == circuit.INV:
                     n_inv += 1
 
-                for pre in G.predecessors(gate):
-                    if pre[1] != cluster_num:
-                        incoming_edges.append((pre, get_subcluster_idx(subclusters, pre[0])))
+                for pre in c.predecessors(gate).tolist():
+                    if groups[pre] != cluster_num:
+                        incoming_edges.append((pre, sc_idx[pre]))
 
-                for post in G.successors(gate):
-                    if post[1] != cluster_num:
-                        outgoing_edges.append((post, get_subcluster_idx(subclusters, post[0])))
+                for post in c.successors(gate).tolist():
+                    if groups[post] != cluster_num:
+                        outgoing_edges.append((post, sc_idx[post]))
 
-            sc_view = nx.subgraph_view(G, filter_node = lambda n: n in sc)
-            sc_depth = len(nx.dag_longest_path(sc_view))
+            sc_depth = depths[i]
 
             print("Input bits:", n_inputs, file = out)
             print("Incoming edges:", len(incoming_edges), file = out)
             for e in incoming_edges:
-                print("    From", e[0][0], "| Sub-cluster", e[1], "(Cluster", str(e[0][1])+")", file = out)
+                print("    From", names[e[0]], "| Sub-cluster", e[1], "(Cluster", str(groups[e[0]])+")", file = out)
             print("Gates:", file = out)
             print("    AND:", n_and, file = out)
             print("    XOR:", n_xor, file = out)
@@ -225,28 +594,41 @@ def stats(args, G, out):
             print("Output bits:", n_outputs, file = out)
             print("Outgoing edges:", len(outgoing_edges), file = out)
             for e in outgoing_edges:
-                print("    To", e[0][0], "| Sub-cluster", e[1], "(Cluster", str(e[0][1])+")", file = out)
-
-
-parser = argparse.ArgumentParser(description="Generate stats on partitioned graphs")
-parser.add_argument("in_json_file", help="Path to input partitioned graph")
-parser.add_argument("--out", help="Path to stats output data file", default=None)
-parser.add_argument("--verbose", help="Print verbose information", action='store_true')
-
-args = parser.parse_args()
-with open(args.in_json_file, 'r') as f:
-    graph = json.load(f)
-
-G = to_networkx(graph)
-
-if args.out:
-    with open(args.out, 'w') as f:
-        stats(args, G, f)
-        rough_sim(args, G, f)
-        rough_sim(args, G, f, distributed=False)
-else:
-    stats(args, G, sys.stdout)
-    rough_sim(args, G, sys.stdout)
-    rough_sim(args, G, sys.stdout, distributed=False)
-
-
+                print("    To", names[e[0]], "| Sub-cluster", e[1], "(Cluster", str(groups[e[0]])+")", file = out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate stats on partitioned graphs")
+    parser.add_argument("in_json_file", help="Path to input partitioned graph")
+    parser.add_argument("--out", help="Path to stats output data file", default=None)
+    parser.add_argument("--verbose", help="Print verbose information", action='store_true')
+    parser.add_argument("--latency", type=int, default=0, help="Ticks for a message to cross a link")
+    parser.add_argument("--msg_overhead", type=int, default=0, help="Ticks a link is busy per message")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Wires per tick per link (0 = unlimited)")
+    parser.add_argument("--batch_window", type=int, default=0, help="Send the wires for a destination together every this many ticks (0 = no batching)")
+    parser.add_argument("--node_speed", type=float, nargs="+", default=None, help="Relative speed of each cluster's node, one value for all or one per cluster")
+    parser.add_argument("--instances", type=int, default=1, help="Also simulate this many instances pipelined through the partition (throughput mode)")
+    parser.add_argument("--tick_seconds", type=float, default=1e-9, help="Seconds per simulated tick, for instances per second")
+    parser.add_argument("--memory_budget", type=int, nargs="+", default=None, help="Memory per cluster, one value for all or one per cluster, to report utilisation against")
+
+    args = parser.parse_args()
+
+    c = circuit.load(args.in_json_file)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            stats(args, c, f)
+            rough_sim(args, c, f)
+            rough_sim(args, c, f, distributed=False)
+            volume_stats(args, c, f)
+            if args.instances > 1:
+                throughput(args, c, f)
+            memory_stats(args, c, f)
+    else:
+        stats(args, c, sys.stdout)
+        rough_sim(args, c, sys.stdout)
+        rough_sim(args, c, sys.stdout, distributed=False)
+        volume_stats(args, c, sys.stdout)
+        if args.instances > 1:
+            throughput(args, c, sys.stdout)
+        memory_stats(args, c, sys.stdout)
@@ -0,0 +1,202 @@
+import argparse
+import concurrent.futures
+import math
+import os
+
+import numpy as np
+
+import circuit
+import critpath
+import fennel
+import multilevel
+import stats
+
+ALGORITHMS = ["fennel", "fennel-weighted", "fennel-output", "fennel-volume", "multilevel", "critical-path"]
+
+# Per-process state, set up once by init_worker
+_circuit = None
+_circuit_name = None
+_centralized_ticks = {}
+_prefixes = {}
+
+
+def config_args(base, config):
+    # Everything fennel.py and stats.py read from their command line args
+    args = argparse.Namespace(**vars(base))
+    args.gamma = config["gamma"]
+    args.partitions = config["clusters"]
+    args.weighted_size = config["algorithm"] == "fennel-weighted"
+    args.output_influence = config["algorithm"] == "fennel-output"
+    args.volume = config["algorithm"] == "fennel-volume"
+    args.verbose = False
+    return args
+
+
+def partition(c, args, algorithm):
+    if algorithm in ("fennel", "fennel-weighted", "fennel-output", "fennel-volume"):
+        return fennel.fennel(c, args)
+    if algorithm == "multilevel":
+        return multilevel.multilevel(c, args.partitions, fennel.node_sizes(args, c))
+    if algorithm == "critical-path":
+        return critpath.critical_path(c, args.partitions, stats.network_model(args),
+                                      stats.node_speeds(args, args.partitions))[0]
+
+    raise ValueError("Unknown algorithm " + algorithm)
+
+
+def centralized_ticks(c):
+    # Does not depend on the partition, so run it once per process
+    if id(c) not in _centralized_ticks:
+        _centralized_ticks[id(c)] = stats.simulate(c, np.zeros(c.n_nodes, dtype=np.int32), 1)
+    return _centralized_ticks[id(c)]
+
+
+def circuit_prefix(c, fraction):
+    # Subcircuit ending at the gate that closes the first `fraction` of
+    # gates; circuit files list gates in topological order
+    if fraction >= 1.0:
+        return c
+    if fraction not in _prefixes:
+        gates = np.flatnonzero(c.gate_mask())
+        last = gates[max(0, int(math.ceil(fraction * len(gates))) - 1)]
+        _prefixes[fraction] = c.prefix(int(last) + 1)
+    return _prefixes[fraction]
+
+
+def evaluate(c, name, base, config, cutoff=None):
+    """Partition c with one configuration and return its results CSV row.
+
+    A "fraction" in the config evaluates only that leading fraction of the
+    circuit's gates. If the distributed simulation runs past cutoff ticks
+    the configuration is abandoned and None is returned. None is also
+    returned if the partition cannot keep to base.memory_budget: Fennel
+    cannot pack the gates, or another algorithm (which does not look at the
+    budget) puts too much memory on a cluster.
+    """
+    args = config_args(base, config)
+    c = circuit_prefix(c, config.get("fraction", 1.0))
+
+    try:
+        c_part = c.with_groups(partition(c, args, config["algorithm"]))
+    except fennel.MemoryBudgetError:
+        return None
+
+    budgets = stats.memory_budgets(args.memory_budget, args.partitions)
+    if budgets is not None and (stats.cluster_memory(c_part, args.partitions) > budgets).any():
+        return None
+
+    network = stats.network_model(args)
+    n_clusters = args.partitions
+    dist_ticks = stats.simulate(c_part, c_part.groups, n_clusters, network, cutoff, speeds=stats.node_speeds(args, n_clusters))
+    if dist_ticks is None:
+        return None
+
+    cross_sources, _ = stats.cross_cluster_edges(c_part)
+    volume = sum(stats.communication_volume(c_part).values())
+
+    return [name, centralized_ticks(c), config["algorithm"], config["clusters"], len(cross_sources),
+            dist_ticks, config["gamma"], base.and_cost, base.xor_cost, base.inv_cost, volume]
+
+
+def format_row(row):
+    return ",".join(str(x) for x in row) + "\n"
+
+
+def append_row(path, row):
+    # One write() on an O_APPEND descriptor, so concurrent sweeps appending
+    # to the same file never interleave within a line
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, format_row(row).encode())
+    finally:
+        os.close(fd)
+
+
+def circuit_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def init_worker(path):
+    global _circuit, _circuit_name
+    # Each worker maps the same binary cache, so the circuit is shared
+    _circuit = circuit.load(path)
+    _circuit_name = circuit_name(path)
+
+
+def _run(job):
+    base, config, cutoff = job
+    return evaluate(_circuit, _circuit_name, base, config, cutoff)
+
+
+def run_search(path, base, strategy, budget, out_file=None, jobs=None, prune_slack=None):
+    """Evaluate configurations proposed by a search strategy (see search.py).
+
+    Keeps one evaluation in flight per worker and feeds every result back
+    to the strategy before asking it for more. With prune_slack, a full
+    circuit evaluation is abandoned once its distributed simulation passes
+    (1 + prune_slack) times the best tick count so far; the strategy then
+    sees that cutoff as its score. Rows of full circuit evaluations are
+    appended to out_file (or printed) as they complete. A configuration that
+    cannot keep to the memory budgets scores worse than any other. Returns
+    the rows.
+    """
+    # Load once up front so the binary cache exists before the workers start
+    circuit.load(path)
+
+    jobs = jobs or os.cpu_count()
+
+    rows = []
+    best = None
+    n_pruned = 0
+    n_infeasible = 0
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(path,)) as pool:
+        pending = {}
+        submitted = 0
+        while True:
+            while len(pending) < jobs and submitted < budget:
+                config = strategy.propose()
+                if config is None:
+                    break
+
+                cutoff = None
+                full = config.get("fraction", 1.0) >= 1.0
+                if full and best is not None and prune_slack is not None:
+                    cutoff = int(best * (1 + prune_slack))
+
+                pending[pool.submit(_run, (base, config, cutoff))] = (config, cutoff)
+                submitted += 1
+
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                config, cutoff = pending.pop(future)
+                row = future.result()
+                if row is None and cutoff is None:
+                    # Only the memory budgets stop a configuration without a cutoff
+                    n_infeasible += 1
+                    strategy.observe(config, math.inf)
+                    continue
+                if row is None:
+                    n_pruned += 1
+                    strategy.observe(config, cutoff)
+                    continue
+
+                strategy.observe(config, row[5])
+                if config.get("fraction", 1.0) < 1.0:
+                    continue
+
+                best = row[5] if best is None else min(best, row[5])
+                if out_file:
+                    append_row(out_file, row)
+                else:
+                    print(format_row(row), end="")
+                rows.append(row)
+
+    if n_pruned:
+        print("Stopped", n_pruned, "configuration(s) early")
+    if n_infeasible:
+        print("Skipped", n_infeasible, "configuration(s) over the memory budget")
+
+    return rows